@@ -1,5 +1,6 @@
 from decimal import Decimal
 
+import orjson
 from flask import Flask
 from flask.json.provider import DefaultJSONProvider
 
@@ -8,7 +9,12 @@ from app.extensions import csrf, db, limiter, login_manager, migrate
 
 
 class _DecimalJSONProvider(DefaultJSONProvider):
-    """Serialize Decimal values as float so tojson works transparently."""
+    """Serialize with orjson; Decimal values become floats.
+
+    Backs both ``jsonify`` and the ``tojson`` filter (which still applies
+    its HTML escaping on top), so chart series and price histories skip
+    the pure-Python encoder.
+    """
 
     @staticmethod
     def default(o):
@@ -16,6 +22,18 @@ class _DecimalJSONProvider(DefaultJSONProvider):
             return float(o)
         return DefaultJSONProvider.default(o)
 
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get("sort_keys", self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get("indent"):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+
+# French digit grouping: non-breaking space as the thousands separator
+_FR_THOUSANDS = str.maketrans({",": "\xa0"})
+
 
 def create_app(config_class=Config):
     app = Flask(__name__)
@@ -50,6 +68,14 @@ def create_app(config_class=Config):
     app.register_blueprint(alerts_bp)
     app.register_blueprint(notifications_bp)
 
+    @app.cli.command("rebuild-positions")
+    def rebuild_positions_command():
+        """Rebuild the user_positions roll-up from transaction history."""
+        import click
+        from app.portfolio.services import rebuild_positions
+        count = rebuild_positions()
+        click.echo(f"Rebuilt {count} positions.")
+
     # Root redirect
     @app.route("/")
     def index():
@@ -61,14 +87,13 @@ def create_app(config_class=Config):
     def currency_filter(value):
         if value is None:
             return "—"
-        return f"{value:,.2f}\xa0€".replace(",", "\xa0")
+        return format(value, ",.2f").translate(_FR_THOUSANDS) + "\xa0€"
 
     @app.template_filter("pct")
     def pct_filter(value):
         if value is None:
             return "—"
-        sign = "+" if value > 0 else ""
-        return f"{sign}{value:.2f}\xa0%"
+        return format(value, "+.2f" if value > 0 else ".2f") + "\xa0%"
 
     @app.template_filter("color")
     def color_filter(value):
@@ -79,10 +104,10 @@ def create_app(config_class=Config):
     @app.context_processor
     def inject_pending_backfills():
         from flask_login import current_user
-        from app.models import BackfillQueue
+        from app.market.services import pending_backfill_count
         count = 0
         if current_user.is_authenticated:
-            count = BackfillQueue.query.filter_by(status="PENDING").count()
+            count = pending_backfill_count()
         return dict(pending_backfills=count)
 
     return app
@@ -1,9 +1,10 @@
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask import Blueprint, abort, flash, redirect, render_template, request, url_for
 from flask_login import current_user, login_required
 
+from app.alerts.services import load_active_alerts, with_current_price
 from app.extensions import db
 from app.market.services import get_or_create_ticker
-from app.models import Alert, DailyPrice
+from app.models import Alert
 
 from .forms import AlertForm
 
@@ -13,28 +14,14 @@ alerts_bp = Blueprint("alerts", __name__, url_prefix="/alerts", template_folder=
 @alerts_bp.route("/")
 @login_required
 def list_alerts():
-    active = (
-        Alert.query.filter_by(user_id=current_user.id, is_active=True, triggered=False)
-        .order_by(Alert.created_at.desc())
-        .all()
-    )
-    triggered = (
+    active = load_active_alerts(current_user.id)
+    triggered = with_current_price(
         Alert.query.filter_by(user_id=current_user.id, triggered=True)
-        .order_by(Alert.last_triggered_at.desc())
-        .limit(20)
-        .all()
+        .order_by(Alert.last_triggered_at.desc()),
+        limit=20,
     )
     form = AlertForm()
 
-    # Enrich with current prices
-    for alert in active + triggered:
-        latest = (
-            DailyPrice.query.filter_by(ticker_id=alert.ticker_id)
-            .order_by(DailyPrice.date.desc())
-            .first()
-        )
-        alert.current_price = latest.close if latest else None
-
     return render_template("alerts.html", active=active, triggered=triggered, form=form)
 
 
@@ -69,17 +56,19 @@ def add_alert():
 @alerts_bp.route("/<int:alert_id>/delete", methods=["POST"])
 @login_required
 def delete_alert(alert_id):
-    alert = Alert.query.filter_by(id=alert_id, user_id=current_user.id).first_or_404()
-    db.session.delete(alert)
+    deleted = (
+        Alert.query.filter_by(id=alert_id, user_id=current_user.id)
+        .delete(synchronize_session=False)
+    )
+    if not deleted:
+        abort(404)
     db.session.commit()
     flash("Alerte supprimée.", "success")
 
     if request.headers.get("HX-Request"):
-        active = Alert.query.filter_by(user_id=current_user.id, is_active=True, triggered=False).all()
-        for a in active:
-            latest = DailyPrice.query.filter_by(ticker_id=a.ticker_id).order_by(DailyPrice.date.desc()).first()
-            a.current_price = latest.close if latest else None
-        return render_template("partials/alerts_list.html", alerts=active)
+        return render_template(
+            "partials/alerts_list.html", alerts=load_active_alerts(current_user.id)
+        )
 
     return redirect(url_for("alerts.list_alerts"))
 
@@ -5,92 +5,124 @@ Alert evaluation logic.
 import logging
 from datetime import datetime, timezone
 
-from sqlalchemy import text
+from flask import g
+from sqlalchemy import and_, func, or_, update
+from sqlalchemy.orm import contains_eager
 
 from app.extensions import db
-from app.models import Alert, DailyPrice, LiveQuote
-from app.notifications.dispatcher import dispatch_alert_notifications
+from app.models import Alert, LiveQuote, Ticker
+from app.notifications.dispatcher import dispatch_many
 
 logger = logging.getLogger(__name__)
 
 
-def evaluate_alerts(*, use_live: bool = False) -> list[dict]:
+def with_current_price(query, limit: int | None = None) -> list[Alert]:
     """
-    Check all active alerts against latest prices.
+    Execute an ``Alert`` query with its ticker joined in, and expose the
+    ticker's latest close as ``alert.current_price`` (``None`` if no price yet).
+    """
+    query = query.join(Alert.ticker).options(contains_eager(Alert.ticker))
+    if limit is not None:
+        query = query.limit(limit)
+    alerts = query.all()
+    for alert in alerts:
+        alert.current_price = alert.ticker.last_close
+    return alerts
+
 
-    When *use_live* is ``True`` the price is read from ``LiveQuote`` first
-    (with a fallback to ``DailyPrice``).
+def load_active_alerts(user_id: int) -> list[Alert]:
+    """
+    Active, not-yet-triggered alerts of *user_id* (newest first) with
+    ``current_price`` set — one joined query, memoised for the request.
+    """
+    cache = g.setdefault("_active_alerts", {})
+    if user_id not in cache:
+        cache[user_id] = with_current_price(
+            Alert.query.filter_by(user_id=user_id, is_active=True, triggered=False)
+            .order_by(Alert.created_at.desc())
+        )
+    return cache[user_id]
 
-    Uses an atomic UPDATE … WHERE triggered=false guard so that concurrent
-    workers (multiple Gunicorn processes, scheduler + cron overlap) can
-    never dispatch the same notification twice.
 
-    Returns list of triggered alerts info.
+def evaluate_alerts(*, use_live: bool = False) -> list[dict]:
     """
-    active_alerts = Alert.query.filter_by(is_active=True, triggered=False).all()
-    triggered = []
+    Check all active alerts against latest prices.
 
-    for alert in active_alerts:
-        current_price = None
+    Prices come from the denormalised ``Ticker.last_close``.  When
+    *use_live* is ``True`` the price is read from ``LiveQuote`` first
+    (with a fallback to ``Ticker.last_close``).
 
-        if use_live:
-            live = LiveQuote.query.filter_by(ticker_id=alert.ticker_id).first()
-            if live and live.price is not None:
-                current_price = live.price
+    The threshold comparison runs in SQL, so only alerts that actually
+    cross come back.  They are then flagged with a single atomic
+    UPDATE … WHERE triggered=false RETURNING id: concurrent workers
+    (multiple Gunicorn processes, scheduler + cron overlap) each get back
+    only the ids they flipped themselves, so the same notification can
+    never be dispatched twice.
 
-        if current_price is None:
-            latest = (
-                DailyPrice.query.filter_by(ticker_id=alert.ticker_id)
-                .order_by(DailyPrice.date.desc())
-                .first()
-            )
-            if not latest or latest.close is None:
-                continue
-            current_price = latest.close
-
-        is_triggered = False
-        if alert.condition == "ABOVE" and current_price >= alert.threshold_price:
-            is_triggered = True
-        elif alert.condition == "BELOW" and current_price <= alert.threshold_price:
-            is_triggered = True
-
-        if is_triggered:
-            # Atomic flag flip — only the first process to execute this
-            # UPDATE will get rowcount == 1; every other concurrent caller
-            # will see rowcount == 0 and skip the notification.
-            now = datetime.now(timezone.utc)
-            result = db.session.execute(
-                text(
-                    "UPDATE alerts "
-                    "SET triggered = true, last_triggered_at = :now "
-                    "WHERE id = :id AND triggered = false"
-                ),
-                {"id": alert.id, "now": now},
-            )
-            db.session.commit()
-
-            if result.rowcount != 1:
-                # Another worker already triggered this alert — skip.
-                continue
-
-            alert_data = {
-                "alert_id": alert.id,
-                "ticker_symbol": alert.ticker.symbol,
-                "condition": alert.condition,
-                "threshold": float(alert.threshold_price),
-                "current_price": float(current_price),
-            }
-            triggered.append(alert_data)
-
-            logger.info(
-                "Alert triggered: %s %s %.2f (current: %.2f)",
-                alert.ticker.symbol, alert.condition, alert.threshold_price, current_price
+    Returns list of triggered alerts info.
+    """
+    query = Alert.query.filter_by(is_active=True, triggered=False).join(Alert.ticker)
+    current_price = Ticker.last_close
+    if use_live:
+        query = query.outerjoin(LiveQuote, Alert.ticker_id == LiveQuote.ticker_id)
+        current_price = func.coalesce(LiveQuote.price, Ticker.last_close)
+
+    # The ticker is read for every triggered alert (log + dispatch) and
+    # comes with the join.
+    crossed = (
+        query.options(contains_eager(Alert.ticker))
+        .add_columns(current_price)
+        .filter(
+            or_(
+                and_(Alert.condition == "ABOVE", current_price >= Alert.threshold_price),
+                and_(Alert.condition == "BELOW", current_price <= Alert.threshold_price),
             )
-
-            # Send notification only after the flag is persisted
-            try:
-                dispatch_alert_notifications(alert_data, alert.user)
-            except Exception as exc:
-                logger.error("Notification dispatch failed for alert %s: %s", alert.id, exc)
+        )
+        .all()
+    )
+    triggered = []
+    if not crossed:
+        return triggered
+
+    # Atomic flag flip — RETURNING tells us which rows *this* process
+    # flipped; alerts already triggered by another worker are skipped.
+    now = datetime.now(timezone.utc)
+    flipped = set(
+        db.session.execute(
+            update(Alert)
+            .where(Alert.id.in_([alert.id for alert, _ in crossed]), Alert.triggered.is_(False))
+            .values(triggered=True, last_triggered_at=now)
+            .returning(Alert.id)
+            .execution_options(synchronize_session=False)
+        ).scalars()
+    )
+    db.session.commit()
+
+    notifications = []
+    for alert, price in crossed:
+        if alert.id not in flipped:
+            continue
+
+        alert_data = {
+            "alert_id": alert.id,
+            "ticker_symbol": alert.ticker.symbol,
+            "condition": alert.condition,
+            "threshold": float(alert.threshold_price),
+            "current_price": float(price),
+        }
+        triggered.append(alert_data)
+
+        logger.info(
+            "Alert triggered: %s %s %.2f (current: %.2f)",
+            alert.ticker.symbol, alert.condition, alert.threshold_price, price
+        )
+
+        notifications.append((alert_data, alert.user_id))
+
+    # Send notifications only after the flags are persisted
+    try:
+        dispatch_many(notifications)
+    except Exception as exc:
+        logger.error("Notification dispatch failed: %s", exc)
 
     return triggered
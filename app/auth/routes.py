@@ -17,7 +17,7 @@ def login():
 
     form = LoginForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(email=form.email.data.lower().strip()).first()
+        user = User.query.filter_by(email=User.normalize_email(form.email.data)).first()
         if user and user.check_password(form.password.data):
             login_user(user, remember=True)
             next_page = request.args.get("next")
@@ -35,12 +35,12 @@ def register():
 
     form = RegisterForm()
     if form.validate_on_submit():
-        existing = User.query.filter_by(email=form.email.data.lower().strip()).first()
+        existing = User.query.filter_by(email=User.normalize_email(form.email.data)).first()
         if existing:
             flash("Un compte existe déjà avec cet email.", "error")
             return render_template("register.html", form=form)
 
-        user = User(email=form.email.data.lower().strip())
+        user = User(email=form.email.data)
         user.set_password(form.password.data)
         db.session.add(user)
         db.session.commit()
@@ -15,6 +15,20 @@ class Config:
             "postgres://", "postgresql://", 1
         )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Explicit pool for server databases: request threads plus the snapshot
+    # worker, backfill thread and scheduler share it.  Pre-ping/recycle drop
+    # connections the server (or Railway's proxy) closed while idle.
+    # SQLite keeps SQLAlchemy's defaults.
+    SQLALCHEMY_ENGINE_OPTIONS = (
+        {}
+        if SQLALCHEMY_DATABASE_URI.startswith("sqlite")
+        else {
+            "pool_size": int(os.environ.get("DB_POOL_SIZE", "20")),
+            "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", "10")),
+            "pool_pre_ping": True,
+            "pool_recycle": 300,
+        }
+    )
     WTF_CSRF_TIME_LIMIT = None  # No CSRF token expiry
 
     # Intraday live quotes (APScheduler)
@@ -1,7 +1,7 @@
 from flask import Blueprint, render_template, request
 from flask_login import login_required
 
-from app.market.services import process_backfill_queue, search_tickers
+from app.market.services import backfill_status_counts, process_backfill_queue, search_tickers
 from app.models import BackfillQueue
 
 market_bp = Blueprint("market", __name__, url_prefix="/market", template_folder="../templates/market")
@@ -31,8 +31,8 @@ def trigger_backfill():
 @login_required
 def backfill_status():
     """HTMX polling endpoint — returns current backfill status."""
-    pending = BackfillQueue.query.filter_by(status="PENDING").count()
-    processing = BackfillQueue.query.filter_by(status="PROCESSING").count()
+    counts = backfill_status_counts()
+    pending, processing = counts["PENDING"], counts["PROCESSING"]
     failed = BackfillQueue.query.filter(BackfillQueue.status == "FAILED").all()
 
     return render_template(
@@ -2,19 +2,33 @@
 Market services — yfinance wrapper for fetching prices, dividends, and ticker info.
 """
 
+import functools
 import logging
+import math
 import os
 import shutil
 import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime, timedelta, timezone
 from decimal import Decimal
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
 import requests as _requests_lib
-import yfinance as yf
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from cachetools import TTLCache, cached
+from sqlalchemy import bindparam, or_, update
 
 from app.extensions import db
 from app.models import BackfillQueue, DailyPrice, Dividend, LiveQuote, Ticker
+from app.upsert import bulk_upsert
+
+# yfinance and pandas (with numpy) are imported inside the functions that
+# use them: they take a large share of worker start-up time and most
+# requests (search, pages, alerts) never touch them.
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 # ---------------------------------------------------------------------------
@@ -39,7 +53,38 @@ def _fix_curl_cffi_ssl():
 
 
 logger = logging.getLogger(__name__)
-_fix_curl_cffi_ssl()
+
+_ssl_fixed = False
+
+
+def _ensure_ssl():
+    """Apply the curl_cffi CA-bundle workaround once, on first yfinance use.
+
+    Kept off the import path so app start-up (every Gunicorn worker, every
+    ``create_app``) does no filesystem work for it.
+    """
+    global _ssl_fixed
+    if _ssl_fixed:
+        return
+    _fix_curl_cffi_ssl()
+    _ssl_fixed = True
+
+
+# Concurrent Yahoo requests when fetching per-symbol dividend histories
+DIVIDEND_FETCH_WORKERS = 8
+
+# Shared HTTP session for direct Yahoo calls: keeps TLS connections alive
+# between searches instead of a new handshake per keystroke.
+_yahoo_session = _requests_lib.Session()
+_yahoo_session.headers.update({"User-Agent": "Mozilla/5.0"})
+_yahoo_session.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=8,
+        pool_maxsize=16,
+        max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504)),
+    ),
+)
 
 
 # ---------------------------------------------------------------------------
@@ -53,8 +98,17 @@ def search_tickers(query: str, max_results: int = 8) -> list[dict]:
     which is more reliable than yfinance's Search class (removed / broken
     across versions).
     """
-    import requests as _requests
+    try:
+        return _yahoo_search(query, max_results)
+    except Exception as e:
+        logger.warning("Ticker search failed for '%s': %s", query, e)
+        return []
+
 
+# Search-as-you-type repeats the same prefixes within seconds; a short TTL
+# keeps Yahoo from being hit on every keystroke.  Failures are not cached.
+@cached(TTLCache(maxsize=256, ttl=60), lock=threading.Lock())
+def _yahoo_search(query: str, max_results: int) -> list[dict]:
     url = "https://query2.finance.yahoo.com/v1/finance/search"
     params = {
         "q": query,
@@ -63,25 +117,29 @@ def search_tickers(query: str, max_results: int = 8) -> list[dict]:
         "listsCount": 0,
         "lang": "en-US",
     }
-    headers = {"User-Agent": "Mozilla/5.0"}
 
-    try:
-        resp = _requests.get(url, params=params, headers=headers, timeout=8)
-        resp.raise_for_status()
-        quotes = resp.json().get("quotes", [])[:max_results]
-        return [
-            {
-                "symbol": q.get("symbol", ""),
-                "name": q.get("shortname") or q.get("longname", ""),
-                "exchange": q.get("exchange", ""),
-                "type": q.get("quoteType", ""),
-            }
-            for q in quotes
-            if q.get("symbol")
-        ]
-    except Exception as e:
-        logger.warning("Ticker search failed for '%s': %s", query, e)
-        return []
+    resp = _yahoo_session.get(url, params=params, timeout=8)
+    resp.raise_for_status()
+    quotes = resp.json().get("quotes", [])[:max_results]
+    return [
+        {
+            "symbol": q.get("symbol", ""),
+            "name": q.get("shortname") or q.get("longname", ""),
+            "exchange": q.get("exchange", ""),
+            "type": q.get("quoteType", ""),
+        }
+        for q in quotes
+        if q.get("symbol")
+    ]
+
+
+@functools.lru_cache(maxsize=1024)
+def _fetch_yahoo_info(symbol: str) -> dict:
+    """Ticker metadata from Yahoo (slow HTTPS call), memoised per process."""
+    import yfinance as yf
+
+    _ensure_ssl()
+    return yf.Ticker(symbol).info or {}
 
 
 def get_or_create_ticker(symbol: str) -> Ticker:
@@ -94,8 +152,7 @@ def get_or_create_ticker(symbol: str) -> Ticker:
     # Fetch metadata from Yahoo
     info = {}
     try:
-        yf_ticker = yf.Ticker(symbol)
-        info = yf_ticker.info or {}
+        info = _fetch_yahoo_info(symbol)
     except Exception as e:
         logger.warning("Could not fetch info for %s: %s", symbol, e)
 
@@ -118,12 +175,16 @@ def get_or_create_ticker(symbol: str) -> Ticker:
 
 def fetch_prices_for_tickers(
     ticker_ids_dates: dict[int, date],
+    with_dividends: bool = False,
 ) -> dict[int, int]:
     """
     Fetch historical daily prices from yfinance for multiple tickers.
 
     Args:
         ticker_ids_dates: mapping of ticker_id -> earliest date needed
+        with_dividends: also upsert the dividends paid in the fetched
+            window, taken from the same download (``actions=True``)
+            instead of a separate per-symbol call
 
     Returns:
         mapping of ticker_id -> number of rows upserted
@@ -132,9 +193,13 @@ def fetch_prices_for_tickers(
         return {}
 
     # Resolve symbols
-    tickers = Ticker.query.filter(Ticker.id.in_(ticker_ids_dates.keys())).all()
-    id_to_symbol = {t.id: t.symbol for t in tickers}
-    symbol_to_id = {t.symbol: t.id for t in tickers}
+    tickers = (
+        db.session.query(Ticker.id, Ticker.symbol)
+        .filter(Ticker.id.in_(ticker_ids_dates.keys()))
+        .all()
+    )
+    id_to_symbol = {tid: symbol for tid, symbol in tickers}
+    symbol_to_id = {symbol: tid for tid, symbol in tickers}
 
     symbols = list(id_to_symbol.values())
     if not symbols:
@@ -144,6 +209,9 @@ def fetch_prices_for_tickers(
     earliest = min(ticker_ids_dates.values()) - timedelta(days=5)
 
     logger.info("Fetching prices for %d tickers from %s", len(symbols), earliest)
+    import yfinance as yf
+
+    _ensure_ssl()
 
     try:
         df = yf.download(
@@ -153,6 +221,7 @@ def fetch_prices_for_tickers(
             threads=True,
             repair=False,
             progress=False,
+            actions=with_dividends,
         )
     except Exception as e:
         logger.error("yf.download failed: %s", e)
@@ -162,87 +231,153 @@ def fetch_prices_for_tickers(
         logger.warning("yf.download returned empty dataframe")
         return {}
 
-    result_counts = {}
-
     # yfinance >=1.0 always returns MultiIndex columns (Price, Ticker),
-    # even for a single symbol.  Normalise to simple columns per symbol.
+    # even for a single symbol.  Reshape to long format once for all symbols.
+    returned = set(df.columns.get_level_values("Ticker"))
+    result_counts = {}
     for symbol in symbols:
-        ticker_id = symbol_to_id[symbol]
-        try:
-            if symbol in df.columns.get_level_values(-1):
-                ticker_df = df.xs(symbol, level="Ticker", axis=1)
-            else:
-                logger.warning("No data returned for %s", symbol)
-                continue
-
-            count = 0
-            for idx, row in ticker_df.iterrows():
-                price_date = idx.date() if hasattr(idx, "date") else idx
-                close_val = row.get("Close")
-                if close_val is None or (hasattr(close_val, "__float__") and str(close_val) == "nan"):
-                    continue
-
-                existing = DailyPrice.query.filter_by(
-                    ticker_id=ticker_id, date=price_date
-                ).first()
-
-                if existing:
-                    existing.open = _safe_decimal(row.get("Open"))
-                    existing.high = _safe_decimal(row.get("High"))
-                    existing.low = _safe_decimal(row.get("Low"))
-                    existing.close = _safe_decimal(row.get("Close"))
-                    existing.volume = _safe_int(row.get("Volume"))
-                else:
-                    dp = DailyPrice(
-                        ticker_id=ticker_id,
-                        date=price_date,
-                        open=_safe_decimal(row.get("Open")),
-                        high=_safe_decimal(row.get("High")),
-                        low=_safe_decimal(row.get("Low")),
-                        close=_safe_decimal(row.get("Close")),
-                        volume=_safe_int(row.get("Volume")),
-                    )
-                    db.session.add(dp)
-                count += 1
-
-            result_counts[ticker_id] = count
+        if symbol in returned:
+            result_counts[symbol_to_id[symbol]] = 0
+        else:
+            logger.warning("No data returned for %s", symbol)
 
-        except Exception as e:
-            logger.error("Error processing prices for %s: %s", symbol, e)
-            result_counts[ticker_id] = 0
+    prices = _price_frame(df, symbol_to_id)
+    result_counts.update(
+        (int(tid), int(n)) for tid, n in prices.groupby("ticker_id").size().items()
+    )
+    rows = prices.astype(object).where(prices.notna(), None).to_dict("records")
 
+    bulk_upsert(
+        DailyPrice,
+        rows,
+        index_elements=["ticker_id", "date"],
+        update_columns=["open", "high", "low", "close", "volume"],
+    )
+    _update_last_close(prices)
+    if with_dividends:
+        # Dividends are immutable once published — keep whatever is stored.
+        bulk_upsert(
+            Dividend, _dividend_rows(df, symbol_to_id), index_elements=["ticker_id", "date"]
+        )
     db.session.commit()
-    logger.info("Upserted prices: %s", result_counts)
+    logger.info("Upserted %d price row(s) for %d ticker(s)", len(rows), len(result_counts))
+    logger.debug("Upserted prices: %s", result_counts)
     return result_counts
 
 
-def fetch_dividends_for_tickers(ticker_ids: list[int]):
-    """Fetch dividend history from yfinance and upsert."""
-    tickers = Ticker.query.filter(Ticker.id.in_(ticker_ids)).all()
+def _update_last_close(prices: "pd.DataFrame"):
+    """
+    Refresh ``Ticker.last_close`` from the newest row per ticker in *prices*.
 
-    for t in tickers:
-        try:
-            yf_ticker = yf.Ticker(t.symbol)
-            divs = yf_ticker.dividends
-            if divs is None or divs.empty:
-                continue
-            for dt_idx, amount in divs.items():
-                d = dt_idx.date() if hasattr(dt_idx, "date") else dt_idx
-                existing = Dividend.query.filter_by(ticker_id=t.id, date=d).first()
-                if not existing and amount > 0:
-                    db.session.add(
-                        Dividend(ticker_id=t.id, date=d, amount_per_share=Decimal(str(float(amount))))
-                    )
-        except Exception as e:
-            logger.warning("Dividend fetch failed for %s: %s", t.symbol, e)
+    The date guard keeps a backfill of older history from overwriting a
+    more recent close already on the ticker.
+    """
+    if prices.empty:
+        return
+    newest = prices.loc[prices.groupby("ticker_id")["date"].idxmax()]
+    params = [
+        {"tid": int(tid), "d": d, "close": close}
+        for tid, d, close in newest[["ticker_id", "date", "close"]].itertuples(index=False)
+    ]
+    tickers = Ticker.__table__
+    db.session.execute(
+        update(tickers)
+        .where(
+            tickers.c.id == bindparam("tid"),
+            or_(
+                tickers.c.last_close_date.is_(None),
+                tickers.c.last_close_date <= bindparam("d"),
+            ),
+        )
+        .values(last_close=bindparam("close"), last_close_date=bindparam("d")),
+        params,
+    )
+
+
+def fetch_dividends_for_tickers(ticker_ids: list[int]):
+    """Fetch dividend history from yfinance and upsert.
 
+    The per-symbol HTTP calls run concurrently in a small thread pool; rows
+    are collected and written from the calling thread only.
+    """
+    tickers = db.session.query(Ticker.id, Ticker.symbol).filter(Ticker.id.in_(ticker_ids)).all()
+    if not tickers:
+        return
+    symbol_to_id = {symbol: tid for tid, symbol in tickers}
+
+    _ensure_ssl()
+    with ThreadPoolExecutor(max_workers=min(DIVIDEND_FETCH_WORKERS, len(symbol_to_id))) as pool:
+        results = list(pool.map(_fetch_dividend_series, symbol_to_id))
+
+    rows: list[dict] = []
+    for symbol, divs in zip(symbol_to_id, results):
+        if divs is None or divs.empty:
+            continue
+        for dt_idx, amount in divs.items():
+            d = dt_idx.date() if hasattr(dt_idx, "date") else dt_idx
+            if amount > 0:
+                rows.append({
+                    "ticker_id": symbol_to_id[symbol],
+                    "date": d,
+                    "amount_per_share": Decimal(str(float(amount))),
+                })
+
+    # Dividends are immutable once published — keep whatever is stored.
+    bulk_upsert(Dividend, rows, index_elements=["ticker_id", "date"])
     db.session.commit()
 
 
+def _fetch_dividend_series(symbol: str):
+    """Dividend series for *symbol* from Yahoo, or ``None`` on failure.
+
+    Runs in a worker thread — must not touch ``db.session``.
+    """
+    import yfinance as yf
+
+    try:
+        return yf.Ticker(symbol).dividends
+    except Exception as e:
+        logger.warning("Dividend fetch failed for %s: %s", symbol, e)
+        return None
+
+
 # ---------------------------------------------------------------------------
 # Backfill logic
 # ---------------------------------------------------------------------------
 
+# The pending count is rendered on every authenticated page (see the
+# context processor in app/__init__.py); a few seconds of staleness is fine.
+_pending_count_cache = TTLCache(maxsize=1, ttl=5)
+_pending_count_lock = threading.Lock()
+
+
+def pending_backfill_count() -> int:
+    """Number of PENDING backfill requests, cached for a few seconds."""
+    with _pending_count_lock:
+        count = _pending_count_cache.get("pending")
+    if count is None:
+        count = BackfillQueue.query.filter_by(status="PENDING").count()
+        with _pending_count_lock:
+            _pending_count_cache["pending"] = count
+    return count
+
+
+def backfill_status_counts() -> dict[str, int]:
+    """``{"PENDING": n, "PROCESSING": m}`` from a single GROUP BY query."""
+    counts = dict(
+        db.session.query(BackfillQueue.status, db.func.count())
+        .filter(BackfillQueue.status.in_(("PENDING", "PROCESSING")))
+        .group_by(BackfillQueue.status)
+        .all()
+    )
+    return {status: counts.get(status, 0) for status in ("PENDING", "PROCESSING")}
+
+
+def _invalidate_pending_count():
+    with _pending_count_lock:
+        _pending_count_cache.pop("pending", None)
+
+
 def request_backfill(ticker_id: int, from_date: date):
     """
     Add a backfill request to the queue if needed.
@@ -275,24 +410,36 @@ def request_backfill(ticker_id: int, from_date: date):
     )
     db.session.add(bq)
     db.session.commit()
+    _invalidate_pending_count()
 
 
-def process_backfill_queue() -> dict:
+def process_backfill_queue(commit: bool = True) -> dict:
     """
     Process all PENDING backfill requests.
     Returns summary of what was processed.
+
+    With ``commit=False`` the final DONE/FAILED status update is left in
+    the session so the caller can commit it with its own follow-up writes.
     """
-    pending = BackfillQueue.query.filter_by(status="PENDING").all()
-    if not pending:
+    # Claim every PENDING row in one statement; RETURNING gives us what
+    # to fetch without loading the ORM objects.
+    claimed = db.session.execute(
+        update(BackfillQueue)
+        .where(BackfillQueue.status == "PENDING")
+        .values(status="PROCESSING")
+        .returning(BackfillQueue.id, BackfillQueue.ticker_id, BackfillQueue.from_date)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if not claimed:
         return {"processed": 0}
+    db.session.commit()
+    _invalidate_pending_count()
 
     # Group by ticker, take earliest date
     ticker_dates: dict[int, date] = {}
-    for bq in pending:
-        bq.status = "PROCESSING"
-        if bq.ticker_id not in ticker_dates or bq.from_date < ticker_dates[bq.ticker_id]:
-            ticker_dates[bq.ticker_id] = bq.from_date
-    db.session.commit()
+    for _, ticker_id, from_date in claimed:
+        if ticker_id not in ticker_dates or from_date < ticker_dates[ticker_id]:
+            ticker_dates[ticker_id] = from_date
 
     # Fetch prices
     result = fetch_prices_for_tickers(ticker_dates)
@@ -301,39 +448,94 @@ def process_backfill_queue() -> dict:
     fetch_dividends_for_tickers(list(ticker_dates.keys()))
 
     # Update queue status
-    for bq in pending:
-        rows = result.get(bq.ticker_id, 0)
-        if rows > 0 or bq.ticker_id in result:
-            bq.status = "DONE"
-        else:
-            bq.status = "FAILED"
-            bq.error_message = "No data returned from Yahoo Finance"
-    db.session.commit()
+    done_ids = [bq_id for bq_id, ticker_id, _ in claimed if ticker_id in result]
+    failed_ids = [bq_id for bq_id, ticker_id, _ in claimed if ticker_id not in result]
+    if done_ids:
+        db.session.execute(
+            update(BackfillQueue)
+            .where(BackfillQueue.id.in_(done_ids))
+            .values(status="DONE")
+            .execution_options(synchronize_session=False)
+        )
+    if failed_ids:
+        db.session.execute(
+            update(BackfillQueue)
+            .where(BackfillQueue.id.in_(failed_ids))
+            .values(status="FAILED", error_message="No data returned from Yahoo Finance")
+            .execution_options(synchronize_session=False)
+        )
+    if commit:
+        db.session.commit()
 
-    return {"processed": len(pending), "results": result}
+    return {"processed": len(claimed), "results": result}
 
 
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
 
-def _safe_decimal(val) -> Optional[Decimal]:
+_OHLCV = ["open", "high", "low", "close", "volume"]
+
+
+def _price_frame(df: "pd.DataFrame", symbol_to_id: dict[str, int]) -> "pd.DataFrame":
+    """
+    Reshape a multi-ticker yfinance download into one long frame of
+    ``DailyPrice`` columns (ticker_id, date, open, high, low, close, volume).
+
+    Done in a single stack rather than one ``xs`` slice per symbol: rows
+    without a close are dropped and volume becomes a nullable integer.
+    """
+    import pandas as pd
+
+    long = df.stack(level="Ticker", future_stack=True)
+    long.columns = [str(c).lower() for c in long.columns]
+    long = long.reindex(columns=_OHLCV)
+    long = long.loc[long["close"].notna()].rename_axis(["date", "symbol"]).reset_index()
+
+    long["ticker_id"] = long["symbol"].map(symbol_to_id)
+    long = long.loc[long["ticker_id"].notna()]
+    long["ticker_id"] = long["ticker_id"].astype(int)
+    long["date"] = pd.to_datetime(long["date"]).dt.date
+    long["volume"] = long["volume"].round().astype("Int64")
+    return long[["ticker_id", "date", *_OHLCV]]
+
+
+def _dividend_rows(df: "pd.DataFrame", symbol_to_id: dict[str, int]) -> list[dict]:
+    """``Dividend`` rows from the ``Dividends`` column of an ``actions=True`` download."""
+    if "Dividends" not in df.columns.get_level_values("Price"):
+        return []
+    divs = df["Dividends"].stack(future_stack=True)
+    divs = divs.loc[divs > 0]
+    return [
+        {
+            "ticker_id": symbol_to_id[symbol],
+            "date": ts.date(),
+            "amount_per_share": Decimal(str(float(amount))),
+        }
+        for (ts, symbol), amount in divs.items()
+        if symbol in symbol_to_id
+    ]
+
+
+def _safe_float(val) -> Optional[float]:
+    """``float(val)``, or ``None`` for missing, NaN and infinite values."""
+    if val is None:
+        return None
     try:
-        if val is None:
-            return None
         f = float(val)
-        if f != f:  # NaN check
-            return None
-        return Decimal(str(f))
     except (TypeError, ValueError):
         return None
+    return f if math.isfinite(f) else None
+
+
+def _safe_decimal(val) -> Optional[Decimal]:
+    f = _safe_float(val)
+    return None if f is None else Decimal(str(f))
 
 
 def _safe_int(val) -> Optional[int]:
-    try:
-        return int(float(val))
-    except (TypeError, ValueError):
-        return None
+    f = _safe_float(val)
+    return None if f is None else int(f)
 
 
 # ---------------------------------------------------------------------------
@@ -347,18 +549,13 @@ def fetch_live_quotes() -> int:
     Uses ``yf.download`` with ``period='1d'`` and ``interval='5m'`` to get
     the most recent 5-minute candle.  Returns the number of tickers updated.
     """
-    from app.models import Alert, Transaction
+    from app.models import Alert, UserPosition
 
-    # Tickers with open positions (SUM qty > 0) or active un-triggered alerts
+    # Tickers with open positions (from the roll-up) or active un-triggered alerts
     position_tids = (
-        db.session.query(Transaction.ticker_id)
-        .group_by(Transaction.ticker_id)
-        .having(db.func.sum(
-            db.case(
-                (Transaction.type == "BUY", Transaction.quantity),
-                else_=-Transaction.quantity,
-            )
-        ) > 0)
+        db.session.query(UserPosition.ticker_id)
+        .filter(UserPosition.quantity > 0)
+        .distinct()
         .all()
     )
     alert_tids = (
@@ -379,6 +576,9 @@ def fetch_live_quotes() -> int:
         return 0
 
     logger.info("[live] Fetching intraday quotes for %d tickers", len(symbols))
+    import yfinance as yf
+
+    _ensure_ssl()
 
     try:
         df = yf.download(
@@ -397,16 +597,10 @@ def fetch_live_quotes() -> int:
         logger.warning("[live] yf.download returned empty dataframe")
         return 0
 
-    # Fetch previous close for each ticker (for change computation)
-    prev_closes: dict[int, Decimal] = {}
-    for tid in all_tids:
-        prev = (
-            DailyPrice.query.filter_by(ticker_id=tid)
-            .order_by(DailyPrice.date.desc())
-            .first()
-        )
-        if prev and prev.close:
-            prev_closes[tid] = prev.close
+    # Previous close for each ticker (for change computation)
+    prev_closes: dict[int, Decimal] = {
+        t.id: t.last_close for t in tickers if t.last_close
+    }
 
     updated = 0
     now = datetime.now(timezone.utc)
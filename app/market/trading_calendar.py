@@ -0,0 +1,43 @@
+"""
+Euronext Paris trading calendar — weekends and the exchange's fixed
+closing days (New Year, Good Friday, Easter Monday, Labour Day,
+Christmas, Boxing Day).
+
+Pure date arithmetic: no pandas, no network, safe to call before the
+app is created.
+"""
+
+from datetime import date, timedelta
+
+
+def _easter_sunday(year: int) -> date:
+    """Gregorian Easter Sunday (anonymous Gregorian algorithm)."""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def euronext_holidays(year: int) -> set[date]:
+    """Weekday closing days of Euronext Paris in *year*."""
+    easter = _easter_sunday(year)
+    return {
+        date(year, 1, 1),
+        easter - timedelta(days=2),  # Good Friday
+        easter + timedelta(days=1),  # Easter Monday
+        date(year, 5, 1),
+        date(year, 12, 25),
+        date(year, 12, 26),
+    }
+
+
+def is_trading_day(d: date) -> bool:
+    """True if Euronext Paris is open on *d*."""
+    return d.weekday() < 5 and d not in euronext_holidays(d.year)
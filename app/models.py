@@ -1,7 +1,7 @@
 from datetime import date, datetime, timezone
-from decimal import Decimal
 
 from flask_login import UserMixin
+from sqlalchemy.orm import validates
 from werkzeug.security import check_password_hash, generate_password_hash
 
 from app.extensions import db
@@ -12,19 +12,35 @@ from app.extensions import db
 # ---------------------------------------------------------------------------
 class User(UserMixin, db.Model):
     __tablename__ = "users"
+    __table_args__ = (
+        # Lookups compare against the plain (indexed) column, so stored
+        # emails must already be normalised.
+        db.CheckConstraint("email = lower(email)", name="ck_users_email_lowercase"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(255), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(255), nullable=False)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    # Bumped whenever the user's user_positions rows are rewritten; part of
+    # the portfolio summary cache key, so every worker sees the change.
+    holdings_version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
 
-    transactions = db.relationship("Transaction", back_populates="user", lazy="dynamic")
-    snapshots = db.relationship("PortfolioSnapshot", back_populates="user", lazy="dynamic")
-    alerts = db.relationship("Alert", back_populates="user", lazy="dynamic")
+    transactions = db.relationship("Transaction", back_populates="user")
+    snapshots = db.relationship("PortfolioSnapshot", back_populates="user")
+    alerts = db.relationship("Alert", back_populates="user")
     notification_preference = db.relationship(
         "NotificationPreference", back_populates="user", uselist=False
     )
 
+    @staticmethod
+    def normalize_email(email: str) -> str:
+        return email.strip().lower()
+
+    @validates("email")
+    def _validate_email(self, key, email):
+        return self.normalize_email(email)
+
     def set_password(self, password: str):
         self.password_hash = generate_password_hash(password)
 
@@ -45,10 +61,13 @@ class Ticker(db.Model):
     currency = db.Column(db.String(10), default="EUR")
     sector = db.Column(db.String(100))
     last_updated = db.Column(db.DateTime)
+    # Denormalised copy of the most recent DailyPrice, kept in sync at ingest
+    last_close = db.Column(db.Numeric(16, 4))
+    last_close_date = db.Column(db.Date)
 
-    daily_prices = db.relationship("DailyPrice", back_populates="ticker", lazy="dynamic")
-    dividends = db.relationship("Dividend", back_populates="ticker", lazy="dynamic")
-    transactions = db.relationship("Transaction", back_populates="ticker", lazy="dynamic")
+    daily_prices = db.relationship("DailyPrice", back_populates="ticker")
+    dividends = db.relationship("Dividend", back_populates="ticker")
+    transactions = db.relationship("Transaction", back_populates="ticker")
 
     def __repr__(self):
         return f"<Ticker {self.symbol}>"
@@ -59,9 +78,13 @@ class Ticker(db.Model):
 # ---------------------------------------------------------------------------
 class Transaction(db.Model):
     __tablename__ = "transactions"
+    __table_args__ = (
+        # Per-user listing newest first (scanned backward) and date replays
+        db.Index("ix_transactions_user_date", "user_id", "date"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     ticker_id = db.Column(db.Integer, db.ForeignKey("tickers.id"), nullable=False, index=True)
     type = db.Column(db.String(4), nullable=False)  # BUY or SELL
     quantity = db.Column(db.Numeric(16, 4), nullable=False)
@@ -70,16 +93,39 @@ class Transaction(db.Model):
     date = db.Column(db.Date, nullable=False)
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    # Total cost including fees, maintained by the database so it can be
+    # summed in SQL.  Only populated once the row has been flushed.
+    total_cost = db.Column(
+        db.Numeric(16, 4),
+        db.Computed(
+            "quantity * price_per_share"
+            " + CASE WHEN type = 'BUY' THEN coalesce(fees, 0) ELSE -coalesce(fees, 0) END",
+            persisted=True,
+        ),
+    )
 
     user = db.relationship("User", back_populates="transactions")
     ticker = db.relationship("Ticker", back_populates="transactions")
 
-    @property
-    def total_cost(self) -> Decimal:
-        """Total cost including fees."""
-        if self.type == "BUY":
-            return self.quantity * self.price_per_share + self.fees
-        return self.quantity * self.price_per_share - self.fees
+
+# ---------------------------------------------------------------------------
+# User Position (roll-up of a user's transactions per ticker)
+# ---------------------------------------------------------------------------
+class UserPosition(db.Model):
+    """
+    Materialised holdings per (user, ticker), replayed from ``Transaction``
+    whenever that pair changes.  Closed positions are kept (quantity 0) for
+    their realized P&L; the row only goes away with its last transaction.
+    """
+    __tablename__ = "user_positions"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    ticker_id = db.Column(db.Integer, db.ForeignKey("tickers.id"), primary_key=True)
+    quantity = db.Column(db.Numeric(16, 4), nullable=False, default=0)
+    total_cost = db.Column(db.Numeric(16, 4), nullable=False, default=0)
+    realized_pnl = db.Column(db.Numeric(16, 4), nullable=False, default=0)
+
+    ticker = db.relationship("Ticker")
 
 
 # ---------------------------------------------------------------------------
@@ -88,11 +134,12 @@ class Transaction(db.Model):
 class DailyPrice(db.Model):
     __tablename__ = "daily_prices"
     __table_args__ = (
+        # Also serves per-ticker lookups and "latest close" (backward scan)
         db.UniqueConstraint("ticker_id", "date", name="uq_daily_price_ticker_date"),
     )
 
     id = db.Column(db.Integer, primary_key=True)
-    ticker_id = db.Column(db.Integer, db.ForeignKey("tickers.id"), nullable=False, index=True)
+    ticker_id = db.Column(db.Integer, db.ForeignKey("tickers.id"), nullable=False)
     date = db.Column(db.Date, nullable=False, index=True)
     open = db.Column(db.Numeric(16, 4))
     high = db.Column(db.Numeric(16, 4))
@@ -126,16 +173,28 @@ class Dividend(db.Model):
 class PortfolioSnapshot(db.Model):
     __tablename__ = "portfolio_snapshots"
     __table_args__ = (
+        # Also serves latest-snapshot lookups and the gap probe (index-only)
         db.UniqueConstraint("user_id", "date", name="uq_snapshot_user_date"),
+        # PostgreSQL only: carries the charted columns so the series read is
+        # an index-only scan.  SQLite has no INCLUDE and uses the key above.
+        db.Index(
+            "ix_portfolio_snapshots_series",
+            "user_id",
+            "date",
+            postgresql_include=["total_value", "total_invested", "total_pnl", "total_pnl_pct"],
+        ).ddl_if(dialect="postgresql"),
     )
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     date = db.Column(db.Date, nullable=False)
     total_value = db.Column(db.Numeric(16, 2), default=0)
     total_invested = db.Column(db.Numeric(16, 2), default=0)
     total_pnl = db.Column(db.Numeric(16, 2), default=0)
     total_pnl_pct = db.Column(db.Numeric(8, 4), default=0)
+    # Allocation chart data ([{"symbol", "weight"}], HTML-safe JSON); only
+    # meaningful on the user's latest snapshot.
+    allocation_json = db.Column(db.Text)
 
     user = db.relationship("User", back_populates="snapshots")
 
@@ -201,12 +260,22 @@ class LiveQuote(db.Model):
 # ---------------------------------------------------------------------------
 class BackfillQueue(db.Model):
     __tablename__ = "backfill_queue"
+    __table_args__ = (
+        # Only the handful of PENDING rows, however many DONE ones pile up;
+        # serves the per-ticker lookup in request_backfill and the claim.
+        db.Index(
+            "ix_backfill_queue_pending",
+            "ticker_id",
+            postgresql_where=db.text("status = 'PENDING'"),
+            sqlite_where=db.text("status = 'PENDING'"),
+        ),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     ticker_id = db.Column(db.Integer, db.ForeignKey("tickers.id"), nullable=False)
     from_date = db.Column(db.Date, nullable=False)
     requested_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
-    status = db.Column(db.String(20), default="PENDING")  # PENDING, PROCESSING, DONE, FAILED
+    status = db.Column(db.String(20), default="PENDING", index=True)  # PENDING, PROCESSING, DONE, FAILED
     error_message = db.Column(db.Text)
 
     ticker = db.relationship("Ticker")
@@ -5,9 +5,58 @@ Notification channels — each channel sends an alert message via a specific ser
 import logging
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 logger = logging.getLogger(__name__)
 
+SLACK_WEBHOOK_PREFIX = "https://hooks.slack.com/"
+
+
+def is_slack_webhook_url(url: str | None) -> bool:
+    """True if *url* points at Slack's Incoming Webhook host."""
+    return bool(url) and url.startswith(SLACK_WEBHOOK_PREFIX)
+
+# One pooled session per process: bursts of alerts reuse the TLS connection
+# to hooks.slack.com.  Slack answers 429 with Retry-After, which Retry honours.
+_session = requests.Session()
+_session.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=8,
+        pool_maxsize=16,
+        max_retries=Retry(
+            total=2,
+            backoff_factor=0.2,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"POST"}),
+            raise_on_status=False,
+        ),
+    ),
+)
+
+# Constant Slack blocks, built once
+_HEADER_BLOCKS = {
+    condition: {
+        "type": "header",
+        "text": {
+            "type": "plain_text",
+            "text": f"{emoji} Alerte PEA Tracker",
+            "emoji": True,
+        },
+    }
+    for condition, emoji in (("ABOVE", "\U0001f4c8"), ("BELOW", "\U0001f4c9"))
+}
+_CONTEXT_BLOCK = {
+    "type": "context",
+    "elements": [
+        {
+            "type": "mrkdwn",
+            "text": "PEA Tracker \u2014 Notification automatique",
+        }
+    ],
+}
+
 
 class SlackChannel:
     """Send alert notifications via Slack Incoming Webhook."""
@@ -39,14 +88,7 @@ class SlackChannel:
 
         payload = {
             "blocks": [
-                {
-                    "type": "header",
-                    "text": {
-                        "type": "plain_text",
-                        "text": f"{emoji} Alerte PEA Tracker",
-                        "emoji": True,
-                    },
-                },
+                _HEADER_BLOCKS["ABOVE" if condition == "ABOVE" else "BELOW"],
                 {
                     "type": "section",
                     "fields": [
@@ -64,15 +106,7 @@ class SlackChannel:
                         },
                     ],
                 },
-                {
-                    "type": "context",
-                    "elements": [
-                        {
-                            "type": "mrkdwn",
-                            "text": "PEA Tracker \u2014 Notification automatique",
-                        }
-                    ],
-                },
+                _CONTEXT_BLOCK,
             ],
             "text": (
                 f"{emoji} {ticker} est {condition_fr} {threshold:.2f} \u20ac "
@@ -81,7 +115,7 @@ class SlackChannel:
         }
 
         try:
-            resp = requests.post(webhook_url, json=payload, timeout=10)
+            resp = _session.post(webhook_url, json=payload, timeout=10)
             if resp.status_code == 200:
                 logger.info("Slack notification sent for %s", ticker)
                 return True
@@ -3,17 +3,90 @@ Notification dispatcher — routes triggered alerts to the user's enabled channe
 """
 
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from cachetools import TTLCache
 
 from app.models import NotificationPreference
-from app.notifications.channels import SlackChannel
+from app.notifications.channels import SlackChannel, is_slack_webhook_url
 
 logger = logging.getLogger(__name__)
 
+# Channel sends are plain HTTP calls (no DB access), so they run off the
+# caller's thread; an alert sweep no longer waits on each webhook in turn.
+_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="notify")
+
+# Preferences as plain ``(slack_enabled, slack_webhook_url)`` tuples, never
+# ORM instances.  The settings page invalidates its own process; the TTL
+# bounds staleness in the other workers.
+_pref_cache: TTLCache = TTLCache(maxsize=2048, ttl=60)
+_pref_lock = threading.Lock()
+_MISSING = object()
+
+
+def _get_pref(user_id: int) -> Optional[tuple[bool, Optional[str]]]:
+    with _pref_lock:
+        pref = _pref_cache.get(user_id, _MISSING)
+    if pref is not _MISSING:
+        return pref
+
+    row = (
+        NotificationPreference.query
+        .with_entities(
+            NotificationPreference.slack_enabled,
+            NotificationPreference.slack_webhook_url,
+        )
+        .filter_by(user_id=user_id)
+        .first()
+    )
+    pref = tuple(row) if row is not None else None
+    with _pref_lock:
+        _pref_cache[user_id] = pref
+    return pref
+
+
+def _get_prefs(user_ids) -> dict[int, Optional[tuple[bool, Optional[str]]]]:
+    """Preferences of several users, uncached ones read in a single query."""
+    prefs, missing = {}, []
+    with _pref_lock:
+        for user_id in user_ids:
+            pref = _pref_cache.get(user_id, _MISSING)
+            if pref is _MISSING:
+                missing.append(user_id)
+            else:
+                prefs[user_id] = pref
+
+    if missing:
+        rows = (
+            NotificationPreference.query
+            .with_entities(
+                NotificationPreference.user_id,
+                NotificationPreference.slack_enabled,
+                NotificationPreference.slack_webhook_url,
+            )
+            .filter(NotificationPreference.user_id.in_(missing))
+            .all()
+        )
+        found = {user_id: (enabled, url) for user_id, enabled, url in rows}
+        with _pref_lock:
+            for user_id in missing:
+                prefs[user_id] = _pref_cache[user_id] = found.get(user_id)
+    return prefs
+
+
+def invalidate_preferences(user_id: int):
+    """Drop the cached preferences of *user_id* (call after saving them)."""
+    with _pref_lock:
+        _pref_cache.pop(user_id, None)
+
 
 def dispatch_alert_notifications(alert_data: dict, user) -> None:
     """
     Send notifications for a triggered alert through all channels
-    the user has enabled.
+    the user has enabled.  Sends are queued on a small thread pool and
+    this function returns without waiting for them.
 
     Parameters
     ----------
@@ -22,17 +95,41 @@ def dispatch_alert_notifications(alert_data: dict, user) -> None:
     user : User
         The user who owns the alert.
     """
-    pref = NotificationPreference.query.filter_by(user_id=user.id).first()
+    _dispatch(alert_data, user.id, _get_pref(user.id))
 
+
+def dispatch_many(notifications: list[tuple[dict, int]]) -> None:
+    """
+    Batch form of :func:`dispatch_alert_notifications` for an alert sweep.
+
+    *notifications* is a list of ``(alert_data, user_id)`` pairs.  The
+    owners' preferences are read in one query and every send is queued
+    at once, so the webhook POSTs of a sweep overlap on the pool.
+    """
+    if not notifications:
+        return
+    prefs = _get_prefs({user_id for _, user_id in notifications})
+    for alert_data, user_id in notifications:
+        _dispatch(alert_data, user_id, prefs[user_id])
+
+
+def _dispatch(alert_data: dict, user_id: int, pref) -> None:
     if pref is None:
-        logger.debug("No notification preferences for user %s — skipping", user.id)
+        logger.debug("No notification preferences for user %s — skipping", user_id)
         return
 
+    slack_enabled, slack_webhook_url = pref
+
     # --- Slack ---
-    if pref.slack_enabled and pref.slack_webhook_url:
-        try:
-            SlackChannel.send(pref.slack_webhook_url, alert_data)
-        except Exception as exc:
-            logger.error(
-                "Slack dispatch failed for user %s: %s", user.id, exc
-            )
+    if slack_enabled and slack_webhook_url:
+        if not is_slack_webhook_url(slack_webhook_url):
+            logger.warning("Ignoring non-Slack webhook URL for user %s", user_id)
+            return
+        future = _EXECUTOR.submit(SlackChannel.send, slack_webhook_url, alert_data)
+        future.add_done_callback(lambda f, uid=user_id: _log_failure(f, "Slack", uid))
+
+
+def _log_failure(future, channel: str, user_id: int):
+    exc = future.exception()
+    if exc is not None:
+        logger.error("%s dispatch failed for user %s: %s", channel, user_id, exc)
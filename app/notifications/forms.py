@@ -1,6 +1,8 @@
 from flask_wtf import FlaskForm
 from wtforms import BooleanField, StringField, SubmitField
-from wtforms.validators import Optional, URL
+from wtforms.validators import Optional, URL, ValidationError
+
+from app.notifications.channels import SLACK_WEBHOOK_PREFIX
 
 
 class NotificationPreferenceForm(FlaskForm):
@@ -11,3 +13,7 @@ class NotificationPreferenceForm(FlaskForm):
         render_kw={"placeholder": "https://hooks.slack.com/services/..."},
     )
     submit = SubmitField("Enregistrer")
+
+    def validate_slack_webhook_url(self, field):
+        if field.data and not field.data.startswith(SLACK_WEBHOOK_PREFIX):
+            raise ValidationError(f"L'URL doit commencer par {SLACK_WEBHOOK_PREFIX}")
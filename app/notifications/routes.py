@@ -4,25 +4,32 @@ from flask_login import current_user, login_required
 from app.extensions import db
 from app.models import NotificationPreference
 from app.notifications import notifications_bp
+from app.notifications.dispatcher import invalidate_preferences
 from app.notifications.forms import NotificationPreferenceForm
+from app.upsert import bulk_upsert
 
 
 @notifications_bp.route("/settings", methods=["GET", "POST"])
 @login_required
 def settings():
+    # No row yet: the form falls back to its field defaults; the row is only
+    # created when the user actually saves.
     pref = NotificationPreference.query.filter_by(user_id=current_user.id).first()
-
-    if pref is None:
-        pref = NotificationPreference(user_id=current_user.id)
-        db.session.add(pref)
-        db.session.commit()
-
     form = NotificationPreferenceForm(obj=pref)
 
     if form.validate_on_submit():
-        pref.slack_enabled = form.slack_enabled.data
-        pref.slack_webhook_url = form.slack_webhook_url.data or None
+        bulk_upsert(
+            NotificationPreference,
+            [{
+                "user_id": current_user.id,
+                "slack_enabled": form.slack_enabled.data,
+                "slack_webhook_url": form.slack_webhook_url.data or None,
+            }],
+            index_elements=["user_id"],
+            update_columns=["slack_enabled", "slack_webhook_url"],
+        )
         db.session.commit()
+        invalidate_preferences(current_user.id)
         flash("Préférences de notification enregistrées.", "success")
         return redirect(url_for("notifications.settings"))
 
@@ -1,53 +1,32 @@
-import threading
 from datetime import date as date_type
 from decimal import Decimal
+from typing import NamedTuple, Optional
 
 from flask import Blueprint, current_app, flash, jsonify, redirect, render_template, request, url_for
 from flask_login import current_user, login_required
-from sqlalchemy import func as sqlfunc
+from sqlalchemy import tuple_
+from sqlalchemy.orm import selectinload
 
 from app.extensions import db
-from app.market.services import get_or_create_ticker, process_backfill_queue, request_backfill
-from app.models import BackfillQueue, DailyPrice, Dividend, PortfolioSnapshot, Ticker, Transaction
+from app.market.services import backfill_status_counts, get_or_create_ticker
+from app.models import DailyPrice, Dividend, PortfolioSnapshot, Ticker, Transaction
 from app.portfolio.forms import TransactionForm
 from app.portfolio.services import (
-    compute_snapshots,
     ensure_snapshots_uptodate,
+    get_dashboard_payload,
     get_portfolio_summary,
     get_positions,
     get_snapshot_series,
+    quantity_held,
+    refresh_position,
 )
-from app.tasks import run_backfill_async
+from app.tasks import SnapshotJob, run_backfill_async, submit_snapshot_job
 
 portfolio_bp = Blueprint(
     "portfolio", __name__, url_prefix="/portfolio", template_folder="../templates/portfolio"
 )
 
 
-# ---------------------------------------------------------------------------
-# Background workers
-# ---------------------------------------------------------------------------
-
-def _background_add(app, ticker_id, tx_date, user_id):
-    """Run backfill + snapshot computation in a background thread."""
-    with app.app_context():
-        try:
-            request_backfill(ticker_id, tx_date)
-            process_backfill_queue()
-            compute_snapshots(user_id, from_date=tx_date)
-        except Exception as e:
-            app.logger.error(f"[background_add] Error: {e}")
-
-
-def _background_delete(app, user_id, tx_date):
-    """Recompute snapshots after deletion in a background thread."""
-    with app.app_context():
-        try:
-            compute_snapshots(user_id, from_date=tx_date)
-        except Exception as e:
-            app.logger.error(f"[background_delete] Error: {e}")
-
-
 # ---------------------------------------------------------------------------
 # Dashboard
 # ---------------------------------------------------------------------------
@@ -57,27 +36,20 @@ def _background_delete(app, user_id, tx_date):
 def dashboard():
     # If there are pending backfills, kick them off asynchronously
     # instead of blocking the page render.
-    pending = BackfillQueue.query.filter_by(status="PENDING").count()
-    processing = BackfillQueue.query.filter_by(status="PROCESSING").count()
+    counts = backfill_status_counts()
+    pending, processing = counts["PENDING"], counts["PROCESSING"]
     if pending > 0:
         run_backfill_async(current_app._get_current_object())
 
-    summary = get_portfolio_summary(current_user.id)
-
-    series = get_snapshot_series(current_user.id, request.args.get("period", "1M"))
-
-    # Prepare JSON-serializable position data for the allocation chart
-    chart_positions = [
-        {"symbol": p["ticker"].symbol, "weight": float(p["weight"])}
-        for p in summary["positions"]
-    ]
+    period = request.args.get("period", "1M")
+    payload = get_dashboard_payload(current_user.id, period)
 
     return render_template(
         "dashboard.html",
-        summary=summary,
-        series=series,
-        period=request.args.get("period", "1M"),
-        chart_positions=chart_positions,
+        summary=payload["summary"],
+        series=payload["series"],
+        period=period,
+        allocation_json=payload["allocation_json"],
         backfill_pending=(pending + processing) > 0,
     )
 
@@ -86,8 +58,8 @@ def dashboard():
 @login_required
 def backfill_status():
     """AJAX polling endpoint — returns current backfill queue status as JSON."""
-    pending = BackfillQueue.query.filter_by(status="PENDING").count()
-    processing = BackfillQueue.query.filter_by(status="PROCESSING").count()
+    counts = backfill_status_counts()
+    pending, processing = counts["PENDING"], counts["PROCESSING"]
     return jsonify({"pending": pending, "processing": processing, "done": (pending + processing) == 0})
 
 
@@ -123,13 +95,7 @@ def dashboard_summary():
 @portfolio_bp.route("/transactions")
 @login_required
 def transactions():
-    page = request.args.get("page", 1, type=int)
-    txns = (
-        Transaction.query
-        .filter_by(user_id=current_user.id)
-        .order_by(Transaction.date.desc())
-        .paginate(page=page, per_page=20)
-    )
+    txns = _transactions_page(*_page_cursor())
     form = TransactionForm()
     return render_template("transactions.html", transactions=txns, form=form)
 
@@ -144,7 +110,7 @@ def add_transaction():
 
         # Validate sell quantity
         if form.type.data == "SELL":
-            held = _quantity_held(current_user.id, ticker.id)
+            held = quantity_held(current_user.id, ticker.id)
             if form.quantity.data > held:
                 flash(f"Vous ne détenez que {held:.4f} actions de {ticker.symbol}.", "error")
                 return redirect(url_for("portfolio.transactions"))
@@ -160,15 +126,15 @@ def add_transaction():
             notes=form.notes.data,
         )
         db.session.add(tx)
+        db.session.flush()
+        refresh_position(current_user.id, ticker.id)
         db.session.commit()
 
-        # Run heavy operations (backfill + snapshots) in a background thread
-        app = current_app._get_current_object()
-        threading.Thread(
-            target=_background_add,
-            args=(app, ticker.id, form.date.data, current_user.id),
-            daemon=True,
-        ).start()
+        # Run heavy operations (backfill + snapshots) in the background worker
+        submit_snapshot_job(
+            current_app._get_current_object(),
+            SnapshotJob(current_user.id, form.date.data, backfill_ticker_id=ticker.id),
+        )
 
         flash(
             f"Transaction {'achat' if tx.type == 'BUY' else 'vente'} de {ticker.symbol} enregistrée. "
@@ -187,29 +153,22 @@ def add_transaction():
 @login_required
 def delete_transaction(tx_id):
     tx = Transaction.query.filter_by(id=tx_id, user_id=current_user.id).first_or_404()
-    tx_date = tx.date
+    tx_date, ticker_id = tx.date, tx.ticker_id
     db.session.delete(tx)
+    db.session.flush()
+    refresh_position(current_user.id, ticker_id)
     db.session.commit()
 
     # Recompute snapshots in background
-    app = current_app._get_current_object()
-    threading.Thread(
-        target=_background_delete,
-        args=(app, current_user.id, tx_date),
-        daemon=True,
-    ).start()
+    submit_snapshot_job(
+        current_app._get_current_object(), SnapshotJob(current_user.id, tx_date)
+    )
 
     flash("Transaction supprimée.", "success")
 
     # If HTMX request, return updated table
     if request.headers.get("HX-Request"):
-        page = request.args.get("page", 1, type=int)
-        txns = (
-            Transaction.query
-            .filter_by(user_id=current_user.id)
-            .order_by(Transaction.date.desc())
-            .paginate(page=page, per_page=20)
-        )
+        txns = _transactions_page(*_page_cursor())
         return render_template("partials/transactions_list.html", transactions=txns)
 
     return redirect(url_for("portfolio.transactions"))
@@ -231,21 +190,23 @@ def position_detail(symbol):
         return redirect(url_for("portfolio.dashboard"))
 
     # Get price history for chart
+    # Plain row tuples, no ORM objects; ``!= 0`` also drops NULLs in SQL.
+    ohlc = (DailyPrice.open, DailyPrice.high, DailyPrice.low, DailyPrice.close)
     prices = (
-        DailyPrice.query.filter_by(ticker_id=ticker.id)
+        db.session.query(DailyPrice.date, *ohlc)
+        .filter(DailyPrice.ticker_id == ticker.id, *(col != 0 for col in ohlc))
         .order_by(DailyPrice.date)
         .all()
     )
     price_data = [
         {
-            "time": p.date.isoformat(),
-            "open": float(p.open),
-            "high": float(p.high),
-            "low": float(p.low),
-            "close": float(p.close),
+            "time": d.isoformat(),
+            "open": float(o),
+            "high": float(h),
+            "low": float(l),
+            "close": float(c),
         }
-        for p in prices
-        if p.open and p.high and p.low and p.close
+        for d, o, h, l, c in prices
     ]
 
     # Get transactions for this ticker
@@ -277,23 +238,53 @@ def position_detail(symbol):
 # Helpers
 # ---------------------------------------------------------------------------
 
-def _quantity_held(user_id: int, ticker_id: int) -> float:
-    result = (
-        db.session.query(
-            sqlfunc.coalesce(
-                sqlfunc.sum(
-                    db.case(
-                        (Transaction.type == "BUY", Transaction.quantity),
-                        else_=-Transaction.quantity,
-                    )
-                ),
-                0,
-            )
-        )
-        .filter(
-            Transaction.user_id == user_id,
-            Transaction.ticker_id == ticker_id,
+TRANSACTIONS_PER_PAGE = 20
+
+
+class TransactionPage(NamedTuple):
+    items: list
+    next_cursor: Optional[dict]  # url_for kwargs for the following page
+
+
+def _page_cursor() -> tuple[Optional[date_type], Optional[int]]:
+    """Read the ``before_date`` / ``before_id`` keyset cursor from the query string."""
+    before_date = request.args.get("before_date", type=date_type.fromisoformat)
+    before_id = request.args.get("before_id", type=int)
+    if before_date is None or before_id is None:
+        return None, None
+    return before_date, before_id
+
+
+def _transactions_page(before_date=None, before_id=None) -> TransactionPage:
+    """One page of the current user's transactions, newest first.
+
+    Keyset pagination on ``(date, id)``: each page seeks past the last row
+    of the previous one through ix_transactions_user_date, so there is no
+    COUNT(*) and deep pages cost the same as the first.  One extra row is
+    fetched to know whether a next page exists.
+
+    The list shows each row's ticker symbol, so tickers are loaded in a
+    single extra IN (...) query instead of one lazy SELECT per row.
+    """
+    query = (
+        Transaction.query
+        .options(selectinload(Transaction.ticker))
+        .filter_by(user_id=current_user.id)
+    )
+    if before_date is not None:
+        query = query.filter(
+            tuple_(Transaction.date, Transaction.id) < (before_date, before_id)
         )
-        .scalar()
+    rows = (
+        query
+        .order_by(Transaction.date.desc(), Transaction.id.desc())
+        .limit(TRANSACTIONS_PER_PAGE + 1)
+        .all()
     )
-    return float(result)
+
+    next_cursor = None
+    if len(rows) > TRANSACTIONS_PER_PAGE:
+        rows = rows[:TRANSACTIONS_PER_PAGE]
+        last = rows[-1]
+        next_cursor = {"before_date": last.date.isoformat(), "before_id": last.id}
+    return TransactionPage(rows, next_cursor)
@@ -3,15 +3,38 @@ Portfolio services — P&L calculations, positions, snapshots.
 """
 
 import logging
+import threading
+from bisect import bisect_left
 from collections import defaultdict
 from datetime import date, timedelta
 from decimal import Decimal
-from typing import Optional
+from itertools import groupby
+from operator import attrgetter
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Optional
 
-from sqlalchemy import func
+from cachetools import TTLCache
+from jinja2.utils import htmlsafe_json_dumps
+from sqlalchemy import and_, bindparam, case, func, lambda_stmt, select, text, update
+from sqlalchemy.orm import contains_eager
 
 from app.extensions import db
-from app.models import DailyPrice, Dividend, LiveQuote, PortfolioSnapshot, Ticker, Transaction
+from app.models import (
+    DailyPrice,
+    Dividend,
+    LiveQuote,
+    PortfolioSnapshot,
+    Ticker,
+    Transaction,
+    User,
+    UserPosition,
+)
+from app.upsert import bulk_upsert, copy_upsert
+
+# numpy is imported inside the snapshot replay, the only code using it:
+# most requests and the web workers' start-up never need it.
+if TYPE_CHECKING:
+    import numpy as np
 
 logger = logging.getLogger(__name__)
 
@@ -20,18 +43,11 @@ logger = logging.getLogger(__name__)
 # Positions & P&L
 # ---------------------------------------------------------------------------
 
-def _compute_holdings(user_id: int) -> dict[int, dict]:
+def _replay_holdings(transactions) -> dict[int, dict]:
     """
-    Compute per-ticker aggregates (qty, cost, realized PnL) for ALL tickers,
-    including fully closed positions.  Used by both get_positions() and
-    get_portfolio_summary() so the transaction loop runs only once per call.
+    Replay date-ordered *transactions* at average cost into per-ticker
+    aggregates (qty, cost, realized PnL), including fully closed positions.
     """
-    transactions = (
-        Transaction.query.filter_by(user_id=user_id)
-        .order_by(Transaction.date)
-        .all()
-    )
-
     holdings: dict[int, dict] = defaultdict(lambda: {
         "qty": Decimal(0),
         "total_cost": Decimal(0),
@@ -53,6 +69,146 @@ def _compute_holdings(user_id: int) -> dict[int, dict]:
     return holdings
 
 
+def _transaction_rows(*criteria):
+    """
+    Date-ordered select of just the transaction columns the replays read;
+    executing it yields light ``Row`` tuples (same attribute names as
+    ``Transaction``) instead of hydrated ORM objects.
+    """
+    return (
+        select(
+            Transaction.user_id,
+            Transaction.ticker_id,
+            Transaction.type,
+            Transaction.quantity,
+            Transaction.price_per_share,
+            Transaction.fees,
+            Transaction.date,
+        )
+        .where(*criteria)
+        .order_by(Transaction.date)
+    )
+
+
+def _compute_holdings(user_id: int) -> dict[int, dict]:
+    """
+    Per-ticker aggregates (qty, cost, realized PnL, ticker) for ALL tickers,
+    including fully closed positions, read from the ``user_positions``
+    roll-up joined to ``tickers``.  Used by both get_positions() and
+    get_portfolio_summary().
+    """
+    positions = (
+        UserPosition.query.filter_by(user_id=user_id)
+        .join(UserPosition.ticker)
+        .options(contains_eager(UserPosition.ticker))
+    )
+    return {
+        p.ticker_id: {
+            "qty": p.quantity,
+            "total_cost": p.total_cost,
+            "realized_pnl": p.realized_pnl,
+            "ticker": p.ticker,
+        }
+        for p in positions
+    }
+
+
+def _position_row(user_id: int, ticker_id: int, h: dict) -> dict:
+    return {
+        "user_id": user_id,
+        "ticker_id": ticker_id,
+        "quantity": h["qty"],
+        "total_cost": h["total_cost"],
+        "realized_pnl": h["realized_pnl"],
+    }
+
+
+def refresh_position(user_id: int, ticker_id: int):
+    """
+    Re-derive the ``UserPosition`` of one (user, ticker) pair from its
+    transactions.  Average cost depends on the order of trades, so a
+    back-dated add or a delete means replaying that ticker — not applying
+    a delta.  Call after the transaction change is flushed; does not commit.
+    """
+    transactions = db.session.execute(_transaction_rows(
+        Transaction.user_id == user_id, Transaction.ticker_id == ticker_id
+    )).all()
+    _bump_holdings_version(User.id == user_id)
+    if not transactions:
+        UserPosition.query.filter_by(user_id=user_id, ticker_id=ticker_id).delete()
+        return
+
+    h = _replay_holdings(transactions)[ticker_id]
+    bulk_upsert(
+        UserPosition,
+        [_position_row(user_id, ticker_id, h)],
+        index_elements=["user_id", "ticker_id"],
+        update_columns=["quantity", "total_cost", "realized_pnl"],
+    )
+
+
+def _bump_holdings_version(*criteria):
+    db.session.execute(
+        update(User).where(*criteria).values(holdings_version=User.holdings_version + 1)
+    )
+
+
+def rebuild_positions(user_id: Optional[int] = None) -> int:
+    """
+    Rebuild the ``user_positions`` roll-up from the full transaction
+    history — for one user, or everyone if *user_id* is ``None``.
+    Returns the number of positions written.
+    """
+    criteria = [Transaction.user_id == user_id] if user_id is not None else []
+    pos_query = UserPosition.query
+    if user_id is not None:
+        pos_query = pos_query.filter_by(user_id=user_id)
+
+    by_user: dict[int, list] = defaultdict(list)
+    rows = db.session.execute(
+        _transaction_rows(*criteria).execution_options(yield_per=1000)
+    )
+    for tx in rows:
+        by_user[tx.user_id].append(tx)
+
+    rows = [
+        _position_row(uid, tid, h)
+        for uid, transactions in by_user.items()
+        for tid, h in _replay_holdings(transactions).items()
+    ]
+
+    pos_query.delete()
+    _bump_holdings_version(*([User.id == user_id] if user_id is not None else []))
+    bulk_upsert(
+        UserPosition,
+        rows,
+        index_elements=["user_id", "ticker_id"],
+        update_columns=["quantity", "total_cost", "realized_pnl"],
+    )
+    db.session.commit()
+    return len(rows)
+
+
+def quantity_held(user_id: int, ticker_id: int) -> Decimal:
+    position = db.session.get(UserPosition, (user_id, ticker_id))
+    return position.quantity if position else Decimal(0)
+
+
+# Close of the trading day before Ticker.last_close_date, correlated to the
+# enclosing ticker row.
+_CLOSE_BEFORE_LAST = (
+    select(DailyPrice.close)
+    .where(
+        DailyPrice.ticker_id == Ticker.id,
+        DailyPrice.date < Ticker.last_close_date,
+    )
+    .order_by(DailyPrice.date.desc())
+    .limit(1)
+    .correlate(Ticker)
+    .scalar_subquery()
+)
+
+
 def get_positions(user_id: int, *, _holdings: dict | None = None) -> list[dict]:
     """
     Compute current positions for a user.
@@ -68,65 +224,31 @@ def get_positions(user_id: int, *, _holdings: dict | None = None) -> list[dict]:
     if not open_tids:
         return []
 
-    # --- Batch-fetch tickers -------------------------------------------------
-    tickers_list = Ticker.query.filter(Ticker.id.in_(open_tids)).all()
-    tickers_map: dict[int, Ticker] = {t.id: t for t in tickers_list}
-
-    # --- Batch-fetch latest 2 prices per ticker (cross-DB compatible) ------
-    from sqlalchemy import literal_column
-    from sqlalchemy.orm import aliased
-
-    # Subquery: rank prices per ticker by date descending
-    ranked = (
-        db.session.query(
-            DailyPrice.ticker_id,
-            DailyPrice.date,
-            DailyPrice.close,
-            func.row_number()
-            .over(
-                partition_by=DailyPrice.ticker_id,
-                order_by=DailyPrice.date.desc(),
-            )
-            .label("rn"),
-        )
-        .filter(DailyPrice.ticker_id.in_(open_tids))
-        .subquery()
-    )
+    # --- Tickers come joined with the holdings ------------------------------
+    tickers_map: dict[int, Ticker] = {tid: holdings[tid]["ticker"] for tid in open_tids}
 
-    price_rows = (
-        db.session.query(
-            ranked.c.ticker_id,
-            ranked.c.date,
-            ranked.c.close,
-            ranked.c.rn,
-        )
-        .filter(ranked.c.rn <= 2)
-        .all()
-    )
-
-    # Build lookup: ticker_id -> {"latest": (close, date), "prev": close}
-    price_lookup: dict[int, dict] = {}
-    for tid, dt, close_val, rn in price_rows:
-        entry = price_lookup.setdefault(tid, {})
-        if rn == 1:
-            entry["latest_close"] = close_val
-            entry["latest_date"] = dt
-        elif rn == 2:
-            entry["prev_close"] = close_val
-
-    # --- Overlay live quotes (if fresh enough, < 15 min) --------------------
+    # --- One query for what the holdings don't carry: the close before the
+    # latest (denormalised on the ticker), via a backward probe on
+    # uq_daily_price_ticker_date, and the live quote if fresh (< 15 min) --
     from datetime import datetime, timedelta as _td, timezone
 
     live_cutoff = datetime.now(timezone.utc) - _td(minutes=15)
-    live_quotes = (
-        LiveQuote.query
-        .filter(
-            LiveQuote.ticker_id.in_(open_tids),
-            LiveQuote.updated_at >= live_cutoff,
+    price_rows = db.session.execute(lambda_stmt(
+        lambda: select(
+            Ticker.id,
+            _CLOSE_BEFORE_LAST.label("prev_close"),
+            LiveQuote.price,
+            LiveQuote.change_pct,
+            LiveQuote.updated_at,
         )
-        .all()
-    )
-    live_map: dict[int, LiveQuote] = {lq.ticker_id: lq for lq in live_quotes}
+        .outerjoin(
+            LiveQuote,
+            (LiveQuote.ticker_id == Ticker.id) & (LiveQuote.updated_at >= live_cutoff),
+        )
+        .where(Ticker.id.in_(open_tids))
+    )).all()
+    prev_closes: dict[int, Decimal] = {row.id: row.prev_close for row in price_rows}
+    live_map = {row.id: row for row in price_rows if row.updated_at is not None}
 
     # --- Build position list -------------------------------------------------
     positions = []
@@ -138,10 +260,9 @@ def get_positions(user_id: int, *, _holdings: dict | None = None) -> list[dict]:
         if not ticker:
             continue
 
-        prices = price_lookup.get(ticker_id, {})
-        current_price = prices.get("latest_close")
-        price_date = prices.get("latest_date")
-        prev_close = prices.get("prev_close", current_price)
+        current_price = ticker.last_close
+        price_date = ticker.last_close_date
+        prev_close = prev_closes.get(ticker_id) or current_price
         is_live = False
         live_updated_at = None
 
@@ -188,17 +309,67 @@ def get_positions(user_id: int, *, _holdings: dict | None = None) -> list[dict]:
             "live_updated_at": live_updated_at,
         })
 
-    # Calculate weights
-    for p in positions:
-        if total_portfolio_value > 0:
-            p["weight"] = (p["market_value"] / total_portfolio_value) * 100
+    # Calculate weights (one division, then a multiply per position)
+    if total_portfolio_value > 0:
+        scale = 100 / total_portfolio_value
+        for p in positions:
+            p["weight"] = p["market_value"] * scale
 
     # Sort by weight descending
     positions.sort(key=lambda p: p["weight"], reverse=True)
     return positions
 
 
+# Portfolio summaries per user, stored as ``(version, summary)``.  The
+# version is (holdings_version, newest close, newest live quote) of the
+# user's tickers, read in one query, so trades and price ingests are
+# misses in every worker; the TTL bounds staleness of dividends and of the
+# 15-minute live-quote cutoff.  Tickers are stored as plain namespaces,
+# never ORM instances.
+_summary_cache: TTLCache = TTLCache(maxsize=1024, ttl=60)
+_summary_lock = threading.Lock()
+
+
+def _summary_version(user_id: int) -> tuple:
+    return tuple(db.session.execute(lambda_stmt(
+        lambda: select(
+            User.holdings_version,
+            func.max(Ticker.last_close_date),
+            func.max(LiveQuote.updated_at),
+        )
+        .select_from(User)
+        .outerjoin(UserPosition, UserPosition.user_id == User.id)
+        .outerjoin(Ticker, Ticker.id == UserPosition.ticker_id)
+        .outerjoin(LiveQuote, LiveQuote.ticker_id == UserPosition.ticker_id)
+        .where(User.id == user_id)
+        .group_by(User.id, User.holdings_version)
+    )).one())
+
+
+def _plain_ticker(ticker: Ticker) -> SimpleNamespace:
+    return SimpleNamespace(**{
+        attr.key: getattr(ticker, attr.key) for attr in Ticker.__mapper__.column_attrs
+    })
+
+
 def get_portfolio_summary(user_id: int) -> dict:
+    """Portfolio-level summary metrics (cached; the positions list is a copy)."""
+    version = _summary_version(user_id)
+    with _summary_lock:
+        cached = _summary_cache.get(user_id)
+    if cached is None or cached[0] != version:
+        summary = _compute_portfolio_summary(user_id)
+        for p in summary["positions"]:
+            p["ticker"] = _plain_ticker(p["ticker"])
+        cached = (version, summary)
+        with _summary_lock:
+            _summary_cache[user_id] = cached
+
+    summary = cached[1]
+    return {**summary, "positions": [dict(p) for p in summary["positions"]]}
+
+
+def _compute_portfolio_summary(user_id: int) -> dict:
     """Compute portfolio-level summary metrics.
 
     Internally calls ``_compute_holdings`` **once** and reuses the result
@@ -238,64 +409,38 @@ def get_portfolio_summary(user_id: int) -> dict:
 def _compute_total_dividends(user_id: int, ticker_ids: list[int]) -> Decimal:
     """Compute total dividends received based on holdings at each ex-date.
 
-    Uses an in-memory approach: loads all transactions and dividends in two
-    queries, then computes holdings at each ex-date in Python.  This avoids
-    the previous N+1 pattern (one sub-query per dividend row).
+    One query: for each dividend, a correlated sub-query sums the user's
+    signed quantities traded up to the ex-date (served by
+    ix_transactions_user_date); dividends paid on a positive holding are
+    then summed.
     """
     if not ticker_ids:
         return Decimal(0)
 
-    # 1. Load all relevant transactions (sorted by date)
-    transactions = (
-        Transaction.query
-        .filter(
+    signed_qty = case(
+        (Transaction.type == "BUY", Transaction.quantity),
+        (Transaction.type == "SELL", -Transaction.quantity),
+        else_=0,
+    )
+    qty_at_ex_date = (
+        select(func.sum(signed_qty))
+        .where(
             Transaction.user_id == user_id,
-            Transaction.ticker_id.in_(ticker_ids),
+            Transaction.ticker_id == Dividend.ticker_id,
+            Transaction.date <= Dividend.date,
         )
-        .order_by(Transaction.date)
-        .all()
+        .correlate(Dividend)
+        .scalar_subquery()
     )
-
-    # 2. Load all dividends for these tickers
-    dividends = (
-        Dividend.query
-        .filter(Dividend.ticker_id.in_(ticker_ids))
-        .order_by(Dividend.date)
-        .all()
+    held = (
+        select(Dividend.amount_per_share, qty_at_ex_date.label("qty"))
+        .where(Dividend.ticker_id.in_(ticker_ids))
+        .subquery()
     )
-
-    if not dividends:
-        return Decimal(0)
-
-    # 3. Pre-compute cumulative holdings per ticker at each transaction date
-    #    ticker_id -> sorted list of (date, cumulative_qty)
-    from bisect import bisect_right
-
-    cum_holdings: dict[int, list[tuple]] = defaultdict(list)
-    running: dict[int, Decimal] = defaultdict(Decimal)
-    for tx in transactions:
-        if tx.type == "BUY":
-            running[tx.ticker_id] += tx.quantity
-        elif tx.type == "SELL":
-            running[tx.ticker_id] -= tx.quantity
-        cum_holdings[tx.ticker_id].append((tx.date, running[tx.ticker_id]))
-
-    # 4. For each dividend, binary-search the qty held at ex-date
-    total = Decimal(0)
-    for div in dividends:
-        entries = cum_holdings.get(div.ticker_id)
-        if not entries:
-            continue
-        # bisect on date: find last transaction with date <= div.date
-        dates = [e[0] for e in entries]
-        idx = bisect_right(dates, div.date) - 1
-        if idx < 0:
-            continue
-        qty = entries[idx][1]
-        if qty > 0:
-            total += qty * div.amount_per_share
-
-    return total
+    total = db.session.execute(
+        select(func.sum(held.c.amount_per_share * held.c.qty)).where(held.c.qty > 0)
+    ).scalar()
+    return Decimal(total or 0)
 
 
 # ---------------------------------------------------------------------------
@@ -307,137 +452,243 @@ def compute_snapshots(user_id: int, from_date: Optional[date] = None):
     Recompute portfolio snapshots for a user from *from_date* to today.
     Uses LOCF (Last Observation Carried Forward) for weekends/holidays.
     """
-    transactions = (
-        Transaction.query.filter_by(user_id=user_id)
-        .order_by(Transaction.date)
-        .all()
-    )
-    if not transactions:
+    compute_snapshots_bulk({user_id: from_date})
+
+
+def compute_snapshots_bulk(
+    from_dates: Optional[dict[int, Optional[date]]] = None, commit: bool = True
+):
+    """
+    Recompute snapshots for several users at once — ``{user_id: from_date}``,
+    ``None`` meaning from the user's first transaction.  With no mapping,
+    every user with transactions is recomputed in full (no user-id list
+    is gathered first).
+
+    The transactions of all users are read in one query and the price
+    history of all their tickers is loaded once and shared; the rows are
+    written in one upsert and committed together (left to the caller with
+    ``commit=False``).
+    """
+    if from_dates is None:
+        from_dates, criteria = {}, []
+    elif not from_dates:
         return
+    else:
+        criteria = [Transaction.user_id.in_(list(from_dates))]
 
-    start = from_date or transactions[0].date
     end = date.today()
-    if start > end:
+    transactions = db.session.execute(
+        _transaction_rows(*criteria)
+        .order_by(None)
+        .order_by(Transaction.user_id, Transaction.date)
+    ).all()
+    by_user = {
+        uid: list(rows) for uid, rows in groupby(transactions, key=attrgetter("user_id"))
+    }
+
+    starts: dict[int, date] = {}
+    for uid, rows in by_user.items():
+        start = from_dates.get(uid) or rows[0].date
+        if start <= end:
+            starts[uid] = start
+    if not starts:
         return
 
-    # Collect all ticker_ids
-    all_ticker_ids = list({tx.ticker_id for tx in transactions})
+    ticker_ids = {tx.ticker_id for uid in starts for tx in by_user[uid]}
+    history = _price_history(ticker_ids, min(starts.values()), end)
+    symbols = dict(
+        db.session.query(Ticker.id, Ticker.symbol).filter(Ticker.id.in_(ticker_ids))
+    )
 
-    # Prefetch all prices for these tickers in range
-    prices_query = (
-        DailyPrice.query
-        .filter(DailyPrice.ticker_id.in_(all_ticker_ids))
-        .filter(DailyPrice.date >= start - timedelta(days=7))
-        .filter(DailyPrice.date <= end)
-        .order_by(DailyPrice.date)
-        .all()
+    snapshots, latest = [], []
+    for uid, start in starts.items():
+        rows = _snapshot_rows(uid, by_user[uid], start, end, history, symbols)
+        snapshots.extend(rows[:-1])
+        latest.append(rows[-1])
+
+    # Bulk upsert snapshots on uq_snapshot_user_date (through COPY for a
+    # large recompute).  Only today's rows overwrite allocation_json;
+    # earlier rows keep whatever they had.
+    value_columns = ["total_value", "total_invested", "total_pnl", "total_pnl_pct"]
+    copy_upsert(
+        PortfolioSnapshot, snapshots, ["user_id", "date"],
+        update_columns=value_columns,
+    )
+    bulk_upsert(
+        PortfolioSnapshot, latest, ["user_id", "date"],
+        update_columns=value_columns + ["allocation_json"],
     )
 
-    # Build price lookup: {(ticker_id, date): Decimal}
-    price_map: dict[tuple[int, date], Decimal] = {}
-    for p in prices_query:
-        price_map[(p.ticker_id, p.date)] = p.close
-
-    # Pre-seed LOCF: fetch the most recent close price BEFORE start for
-    # each ticker so that single-day recomputes (e.g. from_date=today when
-    # no DailyPrice exists yet for today) don't default to 0.
-    last_known_price: dict[int, Decimal] = {}
-    if all_ticker_ids:
-        from sqlalchemy import func, and_
-
-        # Subquery: latest date < start per ticker
-        latest_sub = (
-            db.session.query(
-                DailyPrice.ticker_id,
-                func.max(DailyPrice.date).label("max_date"),
-            )
-            .filter(
-                DailyPrice.ticker_id.in_(all_ticker_ids),
-                DailyPrice.date < start,
-            )
-            .group_by(DailyPrice.ticker_id)
-            .subquery()
-        )
+    if commit:
+        db.session.commit()
+    for uid in starts:
+        _invalidate_series(uid)
+    logger.info(
+        "Computed %d snapshots for %d user(s)", len(snapshots) + len(latest), len(starts)
+    )
 
-        seed_prices = (
-            db.session.query(DailyPrice.ticker_id, DailyPrice.close)
-            .join(
-                latest_sub,
-                and_(
-                    DailyPrice.ticker_id == latest_sub.c.ticker_id,
-                    DailyPrice.date == latest_sub.c.max_date,
-                ),
-            )
-            .all()
+
+def _price_history(ticker_ids, start: date, end: date) -> dict[int, tuple[list, list]]:
+    """
+    ``{ticker_id: (dates, closes)}``, date-ordered: every close in
+    [*start*, *end*] plus the most recent one before *start*, which seeds
+    LOCF so that single-day recomputes (e.g. from today, before today's
+    DailyPrice exists) don't default to 0.
+    """
+    latest_before = (
+        select(DailyPrice.ticker_id, func.max(DailyPrice.date).label("max_date"))
+        .where(DailyPrice.ticker_id.in_(ticker_ids), DailyPrice.date < start)
+        .group_by(DailyPrice.ticker_id)
+        .subquery()
+    )
+    seeds = (
+        select(DailyPrice.ticker_id, DailyPrice.date, DailyPrice.close)
+        .join(
+            latest_before,
+            (DailyPrice.ticker_id == latest_before.c.ticker_id)
+            & (DailyPrice.date == latest_before.c.max_date),
+        )
+    )
+    in_range = (
+        select(DailyPrice.ticker_id, DailyPrice.date, DailyPrice.close)
+        .where(
+            DailyPrice.ticker_id.in_(ticker_ids),
+            DailyPrice.date >= start,
+            DailyPrice.date <= end,
         )
+    )
 
-        for tid, close in seed_prices:
-            last_known_price[tid] = close
-
-    # Iterate day by day
-    current = start
-    snapshots_to_upsert = []
-
-    while current <= end:
-        # Update last known prices (LOCF)
-        for tid in all_ticker_ids:
-            key = (tid, current)
-            if key in price_map:
-                last_known_price[tid] = price_map[key]
-
-        # Compute holdings at this date
-        total_value = Decimal(0)
-        total_invested = Decimal(0)
-
-        holdings: dict[int, dict] = defaultdict(lambda: {"qty": Decimal(0), "cost": Decimal(0)})
-        for tx in transactions:
-            if tx.date > current:
-                break
-            h = holdings[tx.ticker_id]
-            if tx.type == "BUY":
-                h["cost"] += tx.quantity * tx.price_per_share + tx.fees
-                h["qty"] += tx.quantity
-            elif tx.type == "SELL":
-                if h["qty"] > 0:
-                    pru = h["cost"] / h["qty"]
-                    h["cost"] -= pru * tx.quantity
-                    h["qty"] -= tx.quantity
-
-        for tid, h in holdings.items():
-            if h["qty"] > 0:
-                total_invested += h["cost"]
-                price = last_known_price.get(tid, Decimal(0))
-                total_value += h["qty"] * price
+    history: dict[int, tuple[list, list]] = defaultdict(lambda: ([], []))
+    for tid, d, close in db.session.execute(
+        seeds.union_all(in_range).order_by("date")
+    ):
+        dates, closes = history[tid]
+        dates.append(d)
+        closes.append(float(close))
+    return history
+
+
+def _snapshot_rows(
+    user_id: int,
+    transactions: list,
+    start: date,
+    end: date,
+    history: dict[int, tuple[list, list]],
+    symbols: dict[int, str],
+) -> list[dict]:
+    """One snapshot row per day from *start* to *end* (today's carries the allocation)."""
+    import numpy as np
 
-        total_pnl = total_value - total_invested
-        total_pnl_pct = ((total_value / total_invested) - 1) * 100 if total_invested > 0 else 0
+    all_ticker_ids = list({tx.ticker_id for tx in transactions})
+
+    # Dense (day, ticker) grids: row i is ``start + i days``, column j is
+    # ``all_ticker_ids[j]``.  Cells hold the value set on that day, NaN
+    # where nothing changed, and are forward-filled (LOCF) below.
+    column = {tid: j for j, tid in enumerate(all_ticker_ids)}
+    shape = ((end - start).days + 1, len(all_ticker_ids))
+
+    closes = np.full(shape, np.nan)
+    last_known_price: dict[int, float] = {}
+    for tid, j in column.items():
+        dates, ticker_closes = history.get(tid, ((), ()))
+        first = bisect_left(dates, start)
+        if first > 0:  # seed row 0 with the last close before start
+            closes[0, j] = last_known_price[tid] = ticker_closes[first - 1]
+        for d, close in zip(dates[first:], ticker_closes[first:]):
+            closes[(d - start).days, j] = last_known_price[tid] = close
+
+    # Average-cost replay is sequential, but only runs once per
+    # transaction; each one records the ticker's new qty/cost on its day
+    # (transactions before *start* all land on the first row).  Snapshots
+    # are valuations, so this runs in float; exact Decimal accounting stays
+    # in user_positions.
+    qty_set = np.full(shape, np.nan)
+    cost_set = np.full(shape, np.nan)
+    held_qty = [0.0] * len(all_ticker_ids)
+    held_cost = [0.0] * len(all_ticker_ids)
+    for tx in transactions:
+        if tx.date > end:
+            break
+        j = column[tx.ticker_id]
+        quantity, price, fees = float(tx.quantity), float(tx.price_per_share), float(tx.fees)
+        if tx.type == "BUY":
+            held_cost[j] += quantity * price + fees
+            held_qty[j] += quantity
+        elif tx.type == "SELL":
+            if held_qty[j] > 0:
+                pru = held_cost[j] / held_qty[j]
+                held_cost[j] -= pru * quantity
+                held_qty[j] -= quantity
+        row = max((tx.date - start).days, 0)
+        qty_set[row, j] = held_qty[j]
+        cost_set[row, j] = held_cost[j]
+
+    qty = _forward_fill(qty_set)
+    price = _forward_fill(closes)
+    held = qty > 0
+    total_value = np.where(held, qty * price, 0.0).sum(axis=1)
+    total_invested = np.where(held, _forward_fill(cost_set), 0.0).sum(axis=1)
+    total_pnl = total_value - total_invested
+    with np.errstate(divide="ignore", invalid="ignore"):
+        total_pnl_pct = np.where(
+            total_invested > 0, (total_value / total_invested - 1) * 100, 0.0
+        )
 
-        snapshots_to_upsert.append({
+    snapshots_to_upsert = [
+        {
             "user_id": user_id,
-            "date": current,
-            "total_value": total_value,
-            "total_invested": total_invested,
-            "total_pnl": total_pnl,
-            "total_pnl_pct": total_pnl_pct,
-        })
+            "date": start + timedelta(days=i),
+            "total_value": value,
+            "total_invested": invested,
+            "total_pnl": pnl,
+            "total_pnl_pct": pnl_pct,
+        }
+        for i, (value, invested, pnl, pnl_pct) in enumerate(zip(
+            total_value.tolist(), total_invested.tolist(),
+            total_pnl.tolist(), total_pnl_pct.tolist(),
+        ))
+    ]
 
-        current += timedelta(days=1)
-
-    # Bulk upsert snapshots
-    for s in snapshots_to_upsert:
-        existing = PortfolioSnapshot.query.filter_by(
-            user_id=s["user_id"], date=s["date"]
-        ).first()
-        if existing:
-            existing.total_value = s["total_value"]
-            existing.total_invested = s["total_invested"]
-            existing.total_pnl = s["total_pnl"]
-            existing.total_pnl_pct = s["total_pnl_pct"]
-        else:
-            db.session.add(PortfolioSnapshot(**s))
+    # The last row (today) also carries the allocation chart data, from the
+    # final holdings and latest known prices.
+    holdings = {tid: {"qty": held_qty[j]} for tid, j in column.items()}
+    snapshots_to_upsert[-1]["allocation_json"] = _allocation_json(
+        holdings, last_known_price, symbols
+    )
+    return snapshots_to_upsert
+
+
+def _forward_fill(grid: "np.ndarray") -> "np.ndarray":
+    """Carry each column's last non-NaN value down (LOCF); leading gaps become 0."""
+    import numpy as np
+
+    rows = np.where(np.isnan(grid), 0, np.arange(grid.shape[0])[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return np.nan_to_num(grid[rows, np.arange(grid.shape[1])], nan=0.0)
 
-    db.session.commit()
-    logger.info("Computed %d snapshots for user %d", len(snapshots_to_upsert), user_id)
+
+def _allocation_json(
+    holdings: dict[int, dict], prices: dict[int, float], symbols: dict[int, str]
+) -> str:
+    """
+    Serialise ``[{"symbol", "weight"}]`` for the dashboard allocation chart,
+    heaviest first.  The output is HTML-safe so the template can embed it
+    in a ``<script>`` block as-is.
+    """
+    values = {
+        tid: h["qty"] * prices.get(tid, 0.0)
+        for tid, h in holdings.items()
+        if h["qty"] > 0
+    }
+    total = sum(values.values())
+
+    allocation = [
+        {"symbol": symbols[tid], "weight": float(value / total * 100) if total > 0 else 0.0}
+        for tid, value in values.items()
+        if tid in symbols
+    ]
+    allocation.sort(key=lambda a: a["weight"], reverse=True)
+    return str(htmlsafe_json_dumps(allocation, separators=(",", ":")))
 
 
 def ensure_snapshots_uptodate(user_id: int):
@@ -452,73 +703,209 @@ def ensure_snapshots_uptodate(user_id: int):
 
     Safe to call frequently — minimal work when everything is up-to-date.
     """
-    first_tx = (
-        Transaction.query.filter_by(user_id=user_id)
-        .order_by(Transaction.date)
-        .first()
-    )
-    if not first_tx:
-        return
+    ensure_snapshots_uptodate_bulk([user_id])
+
 
-    first_date = first_tx.date
+def ensure_snapshots_uptodate_bulk(user_ids=None):
+    """
+    :func:`ensure_snapshots_uptodate` for several users (all users with
+    transactions when *user_ids* is None).  Every gap found is filled by a
+    single :func:`compute_snapshots_bulk` run.
+
+    One grouped query returns, per user, the first transaction date and
+    the count and last date of the snapshots since then.  A count equal
+    to the span from first to last day proves the series has no hole, so
+    the earliest missing day is simply the one after the last; only users
+    with a hole get the exact calendar scan (_earliest_missing_snapshot).
+    """
     today = date.today()
-    if first_date > today:
-        return
+    firsts = select(Transaction.user_id, func.min(Transaction.date).label("first"))
+    if user_ids is not None:
+        firsts = firsts.where(Transaction.user_id.in_(user_ids))
+    firsts = firsts.group_by(Transaction.user_id).subquery()
+    stmt = (
+        select(
+            firsts.c.user_id,
+            firsts.c.first,
+            func.count(PortfolioSnapshot.date),
+            func.max(PortfolioSnapshot.date),
+        )
+        .outerjoin(
+            PortfolioSnapshot,
+            and_(
+                PortfolioSnapshot.user_id == firsts.c.user_id,
+                PortfolioSnapshot.date >= firsts.c.first,
+                PortfolioSnapshot.date <= today,
+            ),
+        )
+        .group_by(firsts.c.user_id, firsts.c.first)
+    )
+
+    gaps: dict[int, date] = {}
+    for user_id, first_date, count, last_date in db.session.execute(stmt).all():
+        if first_date > today:
+            continue
+        if last_date is None:
+            earliest_missing = first_date
+        elif count == (last_date - first_date).days + 1:
+            earliest_missing = last_date + timedelta(days=1) if last_date < today else None
+        else:
+            earliest_missing = _earliest_missing_snapshot(user_id, first_date, today)
+        if earliest_missing is not None:
+            logger.info(
+                "Missing snapshot(s) for user %d — earliest gap: %s. Recomputing…",
+                user_id, earliest_missing,
+            )
+            gaps[user_id] = earliest_missing
+
+    if gaps:
+        compute_snapshots_bulk(gaps)
+    return len(gaps)
+
+
+# Earliest calendar day in [:first, :today] with no snapshot, found in SQL
+# against the uq_snapshot_user_date index; no date set is built in Python.
+_EARLIEST_MISSING_SQL = {
+    "postgresql": """
+        SELECT cal.d::date AS d
+        FROM generate_series(CAST(:first AS date), CAST(:today AS date), interval '1 day') AS cal(d)
+        WHERE NOT EXISTS (
+            SELECT 1 FROM portfolio_snapshots s
+            WHERE s.user_id = :user_id AND s.date = cal.d::date
+        )
+        ORDER BY cal.d
+        LIMIT 1
+    """,
+    "sqlite": """
+        WITH RECURSIVE cal(d) AS (
+            SELECT :first
+            UNION ALL
+            SELECT date(d, '+1 day') FROM cal WHERE d < :today
+        )
+        SELECT d FROM cal
+        WHERE NOT EXISTS (
+            SELECT 1 FROM portfolio_snapshots s
+            WHERE s.user_id = :user_id AND s.date = cal.d
+        )
+        ORDER BY d
+        LIMIT 1
+    """,
+}
+
+
+def _earliest_missing_snapshot(user_id: int, first_date: date, today: date) -> Optional[date]:
+    dialect = db.session.get_bind().dialect.name
+    sql = _EARLIEST_MISSING_SQL.get(dialect)
+    if sql is None:
+        raise NotImplementedError(f"snapshot gap detection is not supported on {dialect!r}")
+
+    stmt = (
+        text(sql)
+        .bindparams(
+            bindparam("first", type_=db.Date),
+            bindparam("today", type_=db.Date),
+        )
+        .columns(d=db.Date)
+    )
+    return db.session.execute(
+        stmt, {"user_id": user_id, "first": first_date, "today": today}
+    ).scalar()
 
-    # All existing snapshot dates for this user
-    existing_dates = set(
-        row[0]
-        for row in db.session.query(PortfolioSnapshot.date)
+
+def get_dashboard_payload(user_id: int, period: str) -> dict:
+    """
+    Everything the dashboard page renders: summary (positions roll-up
+    joined to tickers), the chart series and the allocation chart data.
+
+    The latest snapshot row is read once and serves both as the series
+    cache key and as the source of the precomputed allocation; that falls
+    back to the live positions until such a snapshot exists.
+    """
+    summary = get_portfolio_summary(user_id)
+
+    latest = (
+        db.session.query(PortfolioSnapshot.date, PortfolioSnapshot.allocation_json)
         .filter_by(user_id=user_id)
-        .filter(PortfolioSnapshot.date >= first_date)
-        .filter(PortfolioSnapshot.date <= today)
-        .all()
+        .order_by(PortfolioSnapshot.date.desc())
+        .first()
     )
+    latest_date, allocation_json = latest if latest else (None, None)
 
-    # Build the full expected set of dates
-    expected_dates: set[date] = set()
-    current = first_date
-    while current <= today:
-        expected_dates.add(current)
-        current += timedelta(days=1)
+    if allocation_json is None:
+        allocation_json = str(htmlsafe_json_dumps([
+            {"symbol": p["ticker"].symbol, "weight": float(p["weight"])}
+            for p in summary["positions"]
+        ]))
 
-    missing = expected_dates - existing_dates
+    return {
+        "summary": summary,
+        "series": _cached_series(user_id, period, latest_date),
+        "allocation_json": allocation_json,
+    }
 
-    if missing:
-        earliest_missing = min(missing)
-        logger.info(
-            "Found %d missing snapshot(s) for user %d — earliest gap: %s. Recomputing…",
-            len(missing), user_id, earliest_missing,
-        )
-        compute_snapshots(user_id, from_date=earliest_missing)
-    elif today not in existing_dates:
-        # Refresh today only if snapshot is genuinely missing
-        compute_snapshots(user_id, from_date=today)
+
+# Chart series per (user, period), keyed on the user's latest snapshot date
+# so a newly appended day is a miss.  compute_snapshots() drops the user's
+# entries when it rewrites past rows; the TTL bounds staleness for rewrites
+# done by another process (cron).
+_series_cache: TTLCache = TTLCache(maxsize=1024, ttl=300)
+_series_lock = threading.Lock()
+
+
+def _invalidate_series(user_id: int):
+    with _series_lock:
+        for key in [k for k in _series_cache if k[0] == user_id]:
+            _series_cache.pop(key, None)
 
 
 def get_snapshot_series(user_id: int, period: str = "1Y") -> list[dict]:
-    """Return portfolio snapshot series for charting."""
+    """Return portfolio snapshot series for charting (cached, do not mutate)."""
+    latest = (
+        db.session.query(func.max(PortfolioSnapshot.date))
+        .filter_by(user_id=user_id)
+        .scalar()
+    )
+    return _cached_series(user_id, period, latest)
+
+
+def _cached_series(user_id: int, period: str, latest: Optional[date]) -> list[dict]:
+    key = (user_id, period, latest, date.today())
+    with _series_lock:
+        series = _series_cache.get(key)
+    if series is None:
+        series = _load_snapshot_series(user_id, period)
+        with _series_lock:
+            _series_cache[key] = series
+    return series
+
+
+def _load_snapshot_series(user_id: int, period: str) -> list[dict]:
     period_map = {
         "1M": 30, "3M": 90, "6M": 180, "1Y": 365, "MAX": 9999
     }
     days = period_map.get(period, 365)
     start = date.today() - timedelta(days=days)
 
-    snapshots = (
-        PortfolioSnapshot.query
-        .filter_by(user_id=user_id)
-        .filter(PortfolioSnapshot.date >= start)
+    # Only the charted columns: skips ORM instances and the allocation_json text
+    rows = db.session.execute(
+        select(
+            PortfolioSnapshot.date,
+            PortfolioSnapshot.total_value,
+            PortfolioSnapshot.total_invested,
+            PortfolioSnapshot.total_pnl,
+            PortfolioSnapshot.total_pnl_pct,
+        )
+        .where(PortfolioSnapshot.user_id == user_id, PortfolioSnapshot.date >= start)
         .order_by(PortfolioSnapshot.date)
-        .all()
     )
 
     return [
         {
-            "date": s.date.isoformat(),
-            "value": float(round(s.total_value, 2)),
-            "invested": float(round(s.total_invested, 2)),
-            "pnl": float(round(s.total_pnl, 2)),
-            "pnl_pct": float(round(s.total_pnl_pct, 2)),
+            "date": d.isoformat(),
+            "value": float(round(value, 2)),
+            "invested": float(round(invested, 2)),
+            "pnl": float(round(pnl, 2)),
+            "pnl_pct": float(round(pnl_pct, 2)),
         }
-        for s in snapshots
+        for d, value, invested, pnl, pnl_pct in rows
     ]
@@ -12,17 +12,18 @@ from datetime import datetime, timedelta, timezone
 
 from zoneinfo import ZoneInfo
 
+from app.market.trading_calendar import is_trading_day
+
 logger = logging.getLogger(__name__)
 
 _scheduler = None  # singleton reference
 
 
 def _is_market_open(app) -> bool:
-    """Return True if we are within Euronext trading hours (CET/CEST)."""
+    """Return True if we are within Euronext trading hours (CET/CEST) on a trading day."""
     cet = ZoneInfo("Europe/Paris")
     now = datetime.now(cet)
-    # Monday=0 … Friday=4
-    if now.weekday() > 4:
+    if not is_trading_day(now.date()):
         return False
     hour = now.hour + now.minute / 60.0
     return app.config["MARKET_OPEN_HOUR"] <= hour < app.config["MARKET_CLOSE_HOUR"]
@@ -5,61 +5,176 @@ No external broker (Celery / Redis) required — tasks run in daemon threads.
 """
 
 import logging
+import queue
 import threading
+import time
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional
 
 logger = logging.getLogger(__name__)
 
-# Simple lock to prevent concurrent backfill runs
-_backfill_lock = threading.Lock()
+# Backfill requests only wake the worker; wake-ups that arrive while it is
+# busy (or within the coalesce window) are served by one more pass.
+BACKFILL_COALESCE_SECONDS = 0.1
+
+_backfill_wake = threading.Event()
+_backfill_worker: Optional[threading.Thread] = None
+_backfill_worker_lock = threading.Lock()
 
 
 def run_backfill_async(app):
     """
     Process pending backfill queue items and recompute snapshots for all
-    affected users in a background thread.
+    affected users on the background backfill worker.
 
-    Safe to call repeatedly — a lock ensures only one backfill runs at a time.
-    If a backfill is already running, the call is silently skipped.
+    Safe to call repeatedly — calls made while a backfill is running are
+    not dropped but coalesced into a single follow-up pass.  The worker
+    thread is started on first use (after Gunicorn has forked).
     """
-    if not _backfill_lock.acquire(blocking=False):
-        logger.info("[tasks] Backfill already running, skipping.")
-        return
+    global _backfill_worker
+    _backfill_wake.set()
+    with _backfill_worker_lock:
+        if _backfill_worker is None or not _backfill_worker.is_alive():
+            _backfill_worker = threading.Thread(
+                target=_backfill_loop, args=(app,), name="backfill-worker", daemon=True
+            )
+            _backfill_worker.start()
+
+
+def _backfill_loop(app):
+    # One app context for the worker's lifetime; the session is removed
+    # after each pass so every pass starts clean and returns its connection.
+    with app.app_context():
+        from app.extensions import db
+
+        while True:
+            _backfill_wake.wait()
+            time.sleep(BACKFILL_COALESCE_SECONDS)
+            _backfill_wake.clear()
+            try:
+                _run_backfill()
+            except Exception as e:
+                logger.error("[tasks] Backfill failed: %s", e)
+            finally:
+                db.session.remove()
 
-    def _run():
+
+def _run_backfill():
+    from app.extensions import db
+    from app.market.services import process_backfill_queue
+    from app.portfolio.services import compute_snapshots_bulk
+
+    # The queue status update and the snapshot rows go out in
+    # one commit; a failed recompute only rolls back its savepoint.
+    result = process_backfill_queue(commit=False)
+    processed = result.get("processed", 0)
+
+    if processed > 0:
+        # Recompute snapshots for every user who has transactions,
+        # straight from one transactions read (no DISTINCT user scan)
         try:
-            with app.app_context():
-                from app.market.services import process_backfill_queue
-                from app.portfolio.services import compute_snapshots
-                from app.models import Transaction
-
-                result = process_backfill_queue()
-                processed = result.get("processed", 0)
-
-                if processed > 0:
-                    # Recompute snapshots for every user who has transactions
-                    user_ids = [
-                        uid
-                        for (uid,) in Transaction.query.with_entities(
-                            Transaction.user_id
-                        )
-                        .distinct()
-                        .all()
-                    ]
-                    for uid in user_ids:
-                        try:
-                            compute_snapshots(uid)
-                        except Exception as e:
-                            logger.error(
-                                "[tasks] snapshot recompute failed for user %d: %s",
-                                uid,
-                                e,
-                            )
-
-                logger.info("[tasks] Backfill done — %d item(s) processed.", processed)
+            with db.session.begin_nested():
+                compute_snapshots_bulk(commit=False)
         except Exception as e:
-            logger.error("[tasks] Backfill failed: %s", e)
-        finally:
-            _backfill_lock.release()
+            logger.error("[tasks] snapshot recompute failed: %s", e)
+    db.session.commit()
+
+    logger.info("[tasks] Backfill done — %d item(s) processed.", processed)
+
+
+# ---------------------------------------------------------------------------
+# Snapshot recompute queue
+# ---------------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class SnapshotJob:
+    """Recompute *user_id*'s snapshots from *from_date*, optionally after
+    backfilling prices for *backfill_ticker_id* from that date."""
+
+    user_id: int
+    from_date: date
+    backfill_ticker_id: Optional[int] = None
+
+
+_snapshot_jobs: "queue.Queue[SnapshotJob]" = queue.Queue()
+_snapshot_worker: Optional[threading.Thread] = None
+_snapshot_worker_lock = threading.Lock()
+
+
+def submit_snapshot_job(app, job: SnapshotJob):
+    """
+    Queue *job* for the single snapshot worker of this process.
+
+    Jobs that pile up while the worker is busy are coalesced: one backfill
+    per ticker and one recompute per user, from the earliest date asked.
+    The worker thread is started on first use (after Gunicorn has forked).
+    """
+    global _snapshot_worker
+    _snapshot_jobs.put(job)
+    with _snapshot_worker_lock:
+        if _snapshot_worker is None or not _snapshot_worker.is_alive():
+            _snapshot_worker = threading.Thread(
+                target=_snapshot_loop, args=(app,), name="snapshot-worker", daemon=True
+            )
+            _snapshot_worker.start()
+
+
+def _snapshot_loop(app):
+    # Same context/session lifecycle as _backfill_loop
+    with app.app_context():
+        from app.extensions import db
+
+        while True:
+            jobs = [_snapshot_jobs.get()]
+            while True:
+                try:
+                    jobs.append(_snapshot_jobs.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                _run_snapshot_jobs(jobs)
+            except Exception as e:
+                logger.error("[tasks] Snapshot jobs failed: %s", e)
+            finally:
+                db.session.remove()
+                for _ in jobs:
+                    _snapshot_jobs.task_done()
+
+
+def _run_snapshot_jobs(jobs: list[SnapshotJob]):
+    from app.extensions import db
+    from app.market.services import process_backfill_queue, request_backfill
+    from app.portfolio.services import compute_snapshots_bulk
+
+    backfills: dict[int, date] = {}
+    recomputes: dict[int, date] = {}
+    for job in jobs:
+        if job.backfill_ticker_id is not None:
+            tid = job.backfill_ticker_id
+            backfills[tid] = min(job.from_date, backfills.get(tid, job.from_date))
+        recomputes[job.user_id] = min(job.from_date, recomputes.get(job.user_id, job.from_date))
+
+    if backfills:
+        try:
+            for ticker_id, from_date in backfills.items():
+                request_backfill(ticker_id, from_date)
+            process_backfill_queue(commit=False)
+        except Exception as e:
+            db.session.rollback()
+            logger.error("[tasks] Backfill for %s failed: %s", list(backfills), e)
+
+    # Committed together with the backfill's queue status update
+    try:
+        with db.session.begin_nested():
+            compute_snapshots_bulk(recomputes, commit=False)
+    except Exception as e:
+        logger.error(
+            "[tasks] snapshot recompute failed for users %s: %s", list(recomputes), e
+        )
+    db.session.commit()
 
-    t = threading.Thread(target=_run, daemon=True)
-    t.start()
+    logger.info(
+        "[tasks] %d snapshot job(s) coalesced into %d recompute(s).",
+        len(jobs), len(recomputes),
+    )
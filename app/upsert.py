@@ -0,0 +1,121 @@
+"""
+Dialect-aware bulk upsert (INSERT … ON CONFLICT) helpers.
+
+PostgreSQL (prod) and SQLite (dev) both support ``ON CONFLICT``; the
+statement is built with the matching dialect's ``insert()`` construct and
+executed in batches so large backfills stay within parameter limits.
+Very large loads on PostgreSQL can go through ``COPY`` instead
+(:func:`copy_upsert`).
+"""
+
+import csv
+import io
+import logging
+
+from sqlalchemy import column, select, table
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.extensions import db
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+# Below this many rows the COPY round-trips (temp table, COPY, merge, drop)
+# cost more than the batched INSERTs they replace.
+COPY_THRESHOLD = 5000
+
+_DIALECT_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+def bulk_upsert(
+    model,
+    rows: list[dict],
+    index_elements: list[str],
+    update_columns: list[str] | None = None,
+    batch_size: int = BATCH_SIZE,
+) -> int:
+    """
+    Insert *rows* into *model*'s table, resolving conflicts on the unique
+    key *index_elements*.
+
+    Existing rows get *update_columns* overwritten with the incoming values;
+    if *update_columns* is empty the conflicting rows are left untouched
+    (``ON CONFLICT DO NOTHING``).
+
+    Does not commit — the caller owns the transaction.  Returns the number
+    of rows sent.
+    """
+    if not rows:
+        return 0
+
+    dialect = db.session.get_bind().dialect.name
+    insert = _DIALECT_INSERTS.get(dialect)
+    if insert is None:
+        raise NotImplementedError(f"bulk_upsert is not supported on {dialect!r}")
+
+    stmt = _on_conflict(insert(model.__table__), index_elements, update_columns)
+
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(stmt, rows[start:start + batch_size])
+
+    return len(rows)
+
+
+def _on_conflict(stmt, index_elements: list[str], update_columns: list[str] | None):
+    if update_columns:
+        return stmt.on_conflict_do_update(
+            index_elements=index_elements,
+            set_={col: stmt.excluded[col] for col in update_columns},
+        )
+    return stmt.on_conflict_do_nothing(index_elements=index_elements)
+
+
+def copy_upsert(
+    model,
+    rows: list[dict],
+    index_elements: list[str],
+    update_columns: list[str] | None = None,
+) -> int:
+    """
+    :func:`bulk_upsert` for large loads.
+
+    On PostgreSQL, with at least ``COPY_THRESHOLD`` rows, the rows are
+    streamed with ``COPY … FROM STDIN`` into a temporary table and merged
+    with a single ``INSERT … SELECT … ON CONFLICT``.  Anything else goes
+    through :func:`bulk_upsert`.
+
+    Every row must have the same keys; ``None`` and empty strings are
+    both loaded as NULL.  Does not commit.  Returns the number of rows sent.
+    """
+    if not rows:
+        return 0
+    if len(rows) < COPY_THRESHOLD or db.session.get_bind().dialect.name != "postgresql":
+        return bulk_upsert(model, rows, index_elements, update_columns)
+
+    target = model.__table__
+    columns = list(rows[0])
+    staging = table(f"_copy_{target.name}", *(column(c) for c in columns))
+    column_list = ", ".join(columns)
+
+    buf = io.StringIO()
+    csv.writer(buf).writerows([row[c] for c in columns] for row in rows)
+    buf.seek(0)
+
+    conn = db.session.connection()
+    conn.exec_driver_sql(
+        f"CREATE TEMP TABLE {staging.name} ON COMMIT DROP AS "
+        f"SELECT {column_list} FROM {target.name} WITH NO DATA"
+    )
+    with conn.connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {staging.name} ({column_list}) FROM STDIN WITH (FORMAT csv)", buf
+        )
+
+    stmt = postgresql.insert(target).from_select(columns, select(*staging.c))
+    conn.execute(_on_conflict(stmt, index_elements, update_columns))
+    conn.exec_driver_sql(f"DROP TABLE {staging.name}")
+    return len(rows)
@@ -6,75 +6,104 @@ Cron schedule: 0 17 * * 1-5  (18h CET, weekdays only)
 Deploy as a **separate Cron Job service** on Railway (not inside the web service).
 """
 
+import logging
+import logging.handlers
 import sys
 import os
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
 
 # Add project root to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app import create_app
 from app.extensions import db
-from app.models import Ticker, Alert, Transaction, LiveQuote
-from app.market.services import fetch_prices_for_tickers, fetch_dividends_for_tickers, process_backfill_queue
+from app.models import Ticker, Alert, LiveQuote
+from app.market.services import fetch_prices_for_tickers, process_backfill_queue
+from app.market.trading_calendar import is_trading_day
 from app.alerts.services import evaluate_alerts
-from app.portfolio.services import compute_snapshots, ensure_snapshots_uptodate
+from app.portfolio.services import ensure_snapshots_uptodate_bulk
 
 # How many days back to fetch on each run (covers weekends + missed days)
 LOOKBACK_DAYS = 7
 
+logger = logging.getLogger("cron")
+
+
+def _configure_logging():
+    """
+    Log to stdout through a memory buffer: records are written in one go
+    when the buffer fills, on an error, or when the process exits, rather
+    than one write per line.
+    """
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(logging.Formatter("%(asctime)s [%(name)s] %(message)s"))
+    buffered = logging.handlers.MemoryHandler(
+        capacity=200, flushLevel=logging.ERROR, target=stream
+    )
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(buffered)
+
 
 def run():
+    # Nothing trades on an exchange holiday: no new closes, dividends or
+    # alert crossings.  Gaps and pending backfills are picked up next run.
+    today = datetime.now(ZoneInfo("Europe/Paris")).date()
+    if not is_trading_day(today):
+        logger.info("Euronext is closed on %s — nothing to do.", today)
+        return
+
     app = create_app()
     with app.app_context():
         # 1. Process any pending backfills first
-        print("[CRON] Processing backfill queue...")
+        logger.info("Processing backfill queue...")
         process_backfill_queue()
 
-        # 2. Fetch recent prices for all tickers in use
-        tickers = Ticker.query.all()
+        # 2. Fetch recent prices and dividends for all tickers in use
+        #    (one download; a new ex-date always falls in the lookback window)
+        tickers = db.session.query(Ticker.id, Ticker.symbol).all()
         if not tickers:
-            print("[CRON] No tickers to update.")
+            logger.info("No tickers to update.")
             return
 
         earliest = date.today() - timedelta(days=LOOKBACK_DAYS)
-        ticker_ids_dates = {t.id: earliest for t in tickers}
-        symbols = [t.symbol for t in tickers]
-        print(f"[CRON] Fetching prices for {len(symbols)} tickers from {earliest}: {symbols}")
-
-        result = fetch_prices_for_tickers(ticker_ids_dates)
-        print(f"[CRON] Prices updated: {result}")
-
-        # 3. Fetch dividends
-        print("[CRON] Fetching dividends...")
-        fetch_dividends_for_tickers([t.id for t in tickers])
-        print("[CRON] Dividends updated.")
-
-        # 4. Recompute portfolio snapshots for all users with transactions
+        ticker_ids_dates = {tid: earliest for tid, _ in tickers}
+        symbols = [symbol for _, symbol in tickers]
+        logger.info("Fetching prices for %d tickers from %s", len(symbols), earliest)
+        logger.debug("symbols=%r", symbols)
+
+        result = fetch_prices_for_tickers(ticker_ids_dates, with_dividends=True)
+        logger.info(
+            "Prices and dividends updated: %d ticker(s), %d row(s)",
+            len(result), sum(result.values()),
+        )
+        logger.debug("rows per ticker=%r", result)
+
+        # 3. Recompute portfolio snapshots for all users with transactions
         #    Uses ensure_snapshots_uptodate to detect and fill any gaps
-        print("[CRON] Recomputing portfolio snapshots (with gap detection)...")
-        user_ids = db.session.query(Transaction.user_id).distinct().all()
-        for (uid,) in user_ids:
-            ensure_snapshots_uptodate(uid)
-        print(f"[CRON] Snapshots recomputed for {len(user_ids)} user(s).")
-
-        # 5. Evaluate price alerts
-        print("[CRON] Evaluating alerts...")
+        logger.info("Recomputing portfolio snapshots (with gap detection)...")
+        recomputed = ensure_snapshots_uptodate_bulk()
+        logger.info("Snapshots recomputed for %d user(s).", recomputed)
+
+        # 4. Evaluate price alerts
+        logger.info("Evaluating alerts...")
         triggered = evaluate_alerts()
         if triggered:
-            print(f"[CRON] {len(triggered)} alert(s) triggered:")
+            logger.info("%d alert(s) triggered:", len(triggered))
             for a in triggered:
-                print(f"  - {a['ticker_symbol']} {a['condition']} {a['threshold']}")
+                logger.info("  - %s %s %s", a["ticker_symbol"], a["condition"], a["threshold"])
         else:
-            print("[CRON] No alerts triggered.")
+            logger.info("No alerts triggered.")
 
-        # 6. Clear stale live quotes (consolidated into daily_prices now)
+        # 5. Clear stale live quotes (consolidated into daily_prices now)
         stale = LiveQuote.query.delete()
         db.session.commit()
-        print(f"[CRON] Cleared {stale} stale live quote(s).")
+        logger.info("Cleared %d stale live quote(s).", stale)
 
-        print("[CRON] Done.")
+        logger.info("Done.")
 
 
 if __name__ == "__main__":
+    _configure_logging()
     run()
@@ -90,12 +90,24 @@ def run_migrations_online():
                 directives[:] = []
                 logger.info('No changes in schema detected.')
 
+    connectable = get_engine()
+
+    # objects declared with .ddl_if(dialect=...) only exist on that backend;
+    # don't let autogenerate / `flask db check` flag them anywhere else
+    def include_object(object, name, type_, reflected, compare_to):
+        ddl_if = getattr(object, '_ddl_if', None)
+        if ddl_if is None or ddl_if.dialect is None:
+            return True
+        dialects = ddl_if.dialect
+        if isinstance(dialects, str):
+            dialects = (dialects,)
+        return connectable.dialect.name in dialects
+
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
     conf_args.setdefault("render_as_batch", True)
-
-    connectable = get_engine()
+    conf_args.setdefault("include_object", include_object)
 
     with connectable.connect() as connection:
         context.configure(
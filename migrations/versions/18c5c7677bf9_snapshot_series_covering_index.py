@@ -0,0 +1,38 @@
+"""snapshot_series_covering_index
+
+Revision ID: 18c5c7677bf9
+Revises: 0b915742d857
+Create Date: 2026-10-15 23:05:12.418306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '18c5c7677bf9'
+down_revision = '0b915742d857'
+branch_labels = None
+depends_on = None
+
+
+# INCLUDE is PostgreSQL-only; elsewhere uq_snapshot_user_date serves the read
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    with op.batch_alter_table('portfolio_snapshots', schema=None) as batch_op:
+        batch_op.create_index(
+            'ix_portfolio_snapshots_series',
+            ['user_id', 'date'],
+            unique=False,
+            postgresql_include=['total_value', 'total_invested', 'total_pnl', 'total_pnl_pct'],
+        )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    with op.batch_alter_table('portfolio_snapshots', schema=None) as batch_op:
+        batch_op.drop_index('ix_portfolio_snapshots_series')
@@ -0,0 +1,29 @@
+"""normalize_user_emails
+
+Revision ID: 48cb79814fe2
+Revises: 6743d3bb74c1
+Create Date: 2026-10-15 10:05:52.906137
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '48cb79814fe2'
+down_revision = '6743d3bb74c1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Normalise existing rows before the constraint goes on
+    op.execute("UPDATE users SET email = lower(trim(email)) WHERE email <> lower(trim(email))")
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_check_constraint('ck_users_email_lowercase', 'email = lower(email)')
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_constraint('ck_users_email_lowercase', type_='check')